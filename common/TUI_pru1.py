@@ -5,7 +5,7 @@ With a menu and 2 panels, side by side.
 In the left one, a YAML editor, in the right one, a preview of the parsed YAML as JSON
 
 This is a demo program, not meant to be used in production.
-The YAML is validated each 3 seconds, and the JSON preview is updated.
+The YAML is validated shortly after the user stops typing, and the JSON preview is updated.
 If errors are found, they are displayed in the JSON panel.
 With info in about the error type and line number.
 
@@ -20,40 +20,90 @@ It uses the Textual library: https://textual.textualize.io/
 
 from __future__ import annotations
 
+import asyncio
 import json
 from datetime import date, datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
-import yaml
-from rich.panel import Panel
-from rich.syntax import Syntax as RichSyntax
-
-from textual.app import App, ComposeResult
-from textual.binding import Binding
-from textual.containers import Container, Horizontal, ScrollableContainer
-from textual.message import Message
-from textual.reactive import reactive
-from textual.widgets import Footer, Header, Static, TextArea
+try:
+	import orjson
+except ImportError:  # fall back to the standard library encoder
+	orjson = None  # type: ignore[assignment]
 
 
 YAML_FILE = Path(__file__).with_name("demo.yaml")
+VALIDATION_DELAY = 0.4
+"""Seconds of editing inactivity before the YAML is validated."""
+
+
+# Converters for the non-JSON types that the YAML safe loader produces
+_JSON_DEFAULTS: dict[type, Callable[[Any], Any]] = {
+	datetime: datetime.isoformat,
+	date: date.isoformat,
+	set: sorted,
+}
 
 
 def _json_default(value: Any) -> Any:
 	"""Fallback serializer for objects not supported by json.dumps."""
-	if isinstance(value, (datetime, date)):
-		return value.isoformat()
-	if isinstance(value, set):
-		return sorted(value)
-	return str(value)
+	convert = _JSON_DEFAULTS.get(type(value))
+	return convert(value) if convert is not None else str(value)
 
 
-class MenuHintBar(Static):
-	"""Displays keyboard shortcuts as a faux menu bar."""
-
-	def on_mount(self) -> None:
-		self.update(
+def _to_json(data: Any) -> str:
+	"""Serialize parsed YAML as indented JSON, using orjson when available."""
+	if orjson is not None:
+		try:
+			return orjson.dumps(
+				data,
+				default=_json_default,
+				option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+			).decode("utf-8")
+		except orjson.JSONEncodeError:
+			pass  # e.g. integers beyond 64 bits, let json handle them
+	return json.dumps(data, indent=2, ensure_ascii=False, default=_json_default)
+
+
+# The editor widgets subclass Textual classes, so they are defined on first
+# use: importing this module for its helpers does not load Textual, Rich or PyYAML.
+_UI_NAMES = ("MenuHintBar", "StatusBar", "PreviewPanel", "YAMLValidated", "YAMLEditorApp")
+_ui: Optional[dict[str, Any]] = None
+
+if TYPE_CHECKING:
+	from textual.app import App
+
+
+def _load_ui() -> dict[str, Any]:
+	"""Import the UI libraries and define the editor classes, once."""
+	global _ui
+	if _ui is not None:
+		return _ui
+
+	import yaml
+
+	try:
+		from yaml import CSafeDumper as _Dumper, CSafeLoader as _Loader
+		_LIBYAML = True
+	except ImportError:  # libyaml bindings not available, use the pure-Python ones
+		from yaml import SafeDumper as _Dumper, SafeLoader as _Loader  # type: ignore[assignment]
+		_LIBYAML = False
+
+	from rich.panel import Panel
+	from rich.syntax import Syntax as RichSyntax
+
+	from textual.app import App, ComposeResult
+	from textual.binding import Binding
+	from textual.containers import Container, Horizontal, ScrollableContainer
+	from textual.message import Message
+	from textual.reactive import reactive
+	from textual.timer import Timer
+	from textual.widgets import Footer, Header, Static, TextArea
+
+	class MenuHintBar(Static):
+		"""Displays keyboard shortcuts as a faux menu bar."""
+
+		MENU_TEXT = (
 			"[b]Menu[/b]  "
 			"[i]Ctrl+S[/i] Save  |  "
 			"[i]Ctrl+R[/i] Reload  |  "
@@ -62,246 +112,345 @@ class MenuHintBar(Static):
 			"[i]F5[/i] Validate"
 		)
 
-
-class StatusBar(Static):
-	"""Simple status bar that shows caret position and validation state."""
-
-	cursor_text: reactive[str] = reactive("Ln 1, Col 1")
-	message_text: reactive[str] = reactive("Ready")
-
-	def compose(self) -> ComposeResult:  # type: ignore[override]
-		yield Static(id="cursor", expand=False)
-		yield Static(id="message", expand=True)
-
-	def on_mount(self) -> None:
-		self.update_contents()
-
-	def update_position(self, row: int, column: int) -> None:
-		self.cursor_text = f"Ln {row + 1}, Col {column + 1}"
-		self.update_contents()
-
-	def update_message(self, message: str) -> None:
-		self.message_text = message
-		self.update_contents()
-
-	def update_contents(self) -> None:
-		cursor_widget = self.query_one("#cursor", Static)
-		cursor_widget.update(self.cursor_text)
-		message_widget = self.query_one("#message", Static)
-		message_widget.update(self.message_text)
-
-
-class PreviewPanel(ScrollableContainer):
-	"""Displays either the JSON preview or YAML errors."""
-
-	DEFAULT_CSS = """
-	PreviewPanel {
-		overflow-y: auto;
-		overflow-x: hidden;
-	}
-
-	PreviewPanel > Static {
-		padding: 0;
-	}
-	"""
-
-	can_focus = True
-
-	def compose(self) -> ComposeResult:
-		self._body = Static(expand=True)
-		yield self._body
-
-	def show_json(self, data: str) -> None:
-		syntax = RichSyntax(
-			data,
-			"json",
-			theme="monokai",
-			line_numbers=True,
-			word_wrap=False,
-		)
-		panel = Panel(syntax, title="JSON Preview", border_style="cyan")
-		self._body.update(panel)
-		self.remove_class("error")
-		self.scroll_home(animate=False)
-
-	def show_error(self, error: Exception) -> None:
-		error_type = type(error).__name__
-		line_info = ""
-		if isinstance(error, yaml.YAMLError):
-			mark = getattr(error, "problem_mark", None)
-			if mark is not None:
-				line_info = f" (line {mark.line + 1}, column {mark.column + 1})"
-		message = (
-			"[bold red]YAML Error[/bold red]\n\n"
-			f"[yellow]{error_type}{line_info}[/yellow]\n\n"
-			f"{error}"
-		)
-		panel = Panel(message, title="Validation", border_style="red")
-		self._body.update(panel)
-		self.add_class("error")
-		self.scroll_home(animate=False)
-
-
-class YAMLValidated(Message):
-	"""Message emitted after validation run."""
-
-	def __init__(self, success: bool, error: Optional[Exception] = None) -> None:
-		self.success = success
-		self.error = error
-		super().__init__()
-
-
-class YAMLEditorApp(App):
-	"""Main Textual application implementing the YAML editor demo."""
-
-	CSS = """
-	Screen {
-		layout: vertical;
-	}
-
-	Horizontal {
-		height: 1fr;
-	}
-
-	#content {
-		height: 1fr;
-	}
-
-	#editor {
-		border: solid green;
-		width: 1fr;
-		min-width: 40;
-		background: $surface-darken-2;
-		color: $text;
-	}
-
-	#preview {
-		border: solid blue;
-		padding: 1 2;
-		overflow: auto;
-		width: 1fr;
-		min-width: 40;
-		background: $surface-darken-1;
-	}
-
-	#preview.error {
-		border: solid $error;
-	}
-
-	#status-bar {
-		dock: bottom;
-		height: 1;
-		background: $surface;
-		color: $text-muted;
-	}
-
-	#status-bar Static {
-		padding: 0 1;
-	}
-	"""
-
-	TITLE = "YAML Editor Demo"
-	BINDINGS = [
-		Binding("ctrl+s", "save_yaml", "Save"),
-		Binding("ctrl+r", "reload_yaml", "Reload"),
-		Binding("ctrl+f", "format_yaml", "Format"),
-		Binding("ctrl+q", "quit", "Quit"),
-		Binding("f5", "validate_now", "Validate"),
-	]
-
-	preview_panel: PreviewPanel
-	yaml_editor: TextArea
-	status_bar: StatusBar
-
-	def compose(self) -> ComposeResult:
-		yield Header()
-		yield MenuHintBar(id="menu-bar")
-		with Container(id="content"):
-			with Horizontal():
-				self.yaml_editor = TextArea(
-					language="yaml",
-					show_line_numbers=True,
-					theme="dracula",
-					id="editor",
+		def on_mount(self) -> None:
+			self.update(self.MENU_TEXT)
+
+
+	class StatusBar(Static):
+		"""Simple status bar that shows caret position and validation state."""
+
+		# The labels are built with these values and repaint themselves on change
+		cursor_text: reactive[str] = reactive("Ln 1, Col 1", repaint=False, init=False)
+		message_text: reactive[str] = reactive("Ready", repaint=False, init=False)
+
+		def compose(self) -> ComposeResult:  # type: ignore[override]
+			self._cursor = Static(self.cursor_text, id="cursor", expand=False)
+			self._message = Static(self.message_text, id="message", expand=True)
+			yield self._cursor
+			yield self._message
+
+		def watch_cursor_text(self, cursor_text: str) -> None:
+			self._cursor.update(cursor_text)
+
+		def watch_message_text(self, message_text: str) -> None:
+			self._message.update(message_text)
+
+		def update_position(self, row: int, column: int) -> None:
+			self.cursor_text = f"Ln {row + 1}, Col {column + 1}"
+
+		def update_message(self, message: str) -> None:
+			self.message_text = message
+
+
+	class PreviewPanel(ScrollableContainer):
+		"""Displays either the JSON preview or YAML errors."""
+
+		DEFAULT_CSS = """
+		PreviewPanel {
+			overflow-y: auto;
+			overflow-x: hidden;
+		}
+
+		PreviewPanel > Static {
+			padding: 0;
+		}
+		"""
+
+		can_focus = True
+		MAX_PREVIEW_LINES = 5000
+		"""Longer previews are cut to keep highlighting cost bounded."""
+
+		def compose(self) -> ComposeResult:
+			self._body = Static(expand=True)
+			# Last JSON string shown and its renderable, to avoid re-highlighting it
+			self._last_json: Optional[str] = None
+			self._cached_renderable: Optional[Panel] = None
+			yield self._body
+
+		def show_json(self, data: str) -> None:
+			if data is self._last_json and self._cached_renderable is not None:
+				if not self.has_class("error"):
+					# Already on screen, keep the user's scroll position
+					return
+				panel = self._cached_renderable
+			else:
+				syntax = RichSyntax(
+					self._truncate(data, "# ... truncated"),
+					"json",
+					theme="monokai",
+					line_numbers=True,
+					word_wrap=False,
+					code_width=None,
+					background_color="default",
 				)
-				yield self.yaml_editor
-				self.preview_panel = PreviewPanel(id="preview")
-				yield self.preview_panel
-		self.status_bar = StatusBar(id="status-bar")
-		yield self.status_bar
-		yield Footer()
-
-	async def on_mount(self) -> None:
-		self._ensure_yaml_file()
-		self._load_yaml()
-		self.set_interval(3.0, self._validate_yaml, name="validator")
-
-	async def on_textarea_changed(self, event: TextArea.Changed) -> None:  # type: ignore[override]
-		self.status_bar.update_message("Modified (unsaved)")
-
-	async def on_textarea_cursor_moved(self, event: TextArea.CursorMoved) -> None:  # type: ignore[override]
-		self.status_bar.update_position(event.cursor_location.row, event.cursor_location.column)
-
-	def _ensure_yaml_file(self) -> None:
-		if not YAML_FILE.exists():
-			YAML_FILE.write_text("# Start editing YAML here\n", encoding="utf-8")
-
-	def _load_yaml(self) -> None:
-		self.yaml_editor.load_text(YAML_FILE.read_text(encoding="utf-8"))
-		self.status_bar.update_message("Loaded")
-		self._validate_yaml()
-
-	def _validate_yaml(self) -> None:
-		text = self.yaml_editor.text
-		try:
-			parsed = yaml.safe_load(text) if text.strip() else None
-			json_output = (
-				json.dumps(parsed, indent=2, ensure_ascii=False, default=_json_default)
-				if parsed is not None
-				else "null"
+				panel = Panel(syntax, title="JSON Preview", border_style="cyan")
+				self._last_json = data
+				self._cached_renderable = panel
+			self._body.update(panel)
+			self.remove_class("error")
+			self.scroll_home(animate=False)
+
+		def show_error(self, error: Exception) -> None:
+			error_type = type(error).__name__
+			line_info = ""
+			if isinstance(error, yaml.YAMLError):
+				mark = getattr(error, "problem_mark", None)
+				if mark is not None:
+					line_info = f" (line {mark.line + 1}, column {mark.column + 1})"
+			message = (
+				"[bold red]YAML Error[/bold red]\n\n"
+				f"[yellow]{error_type}{line_info}[/yellow]\n\n"
+				f"{self._truncate(str(error), '...')}"
 			)
-			self.preview_panel.show_json(json_output)
-			self.status_bar.update_message("YAML valid")
-			self.save_yaml(write_status=False)
-			self.post_message(YAMLValidated(True))
-		except Exception as error:  # pylint: disable=broad-except
-			self.preview_panel.show_error(error)
-			self.status_bar.update_message("YAML invalid")
-			self.post_message(YAMLValidated(False, error))
-
-	def action_save_yaml(self) -> None:
-		self.save_yaml()
-
-	def save_yaml(self, write_status: bool = True) -> None:
-		YAML_FILE.write_text(self.yaml_editor.text, encoding="utf-8")
-		if write_status:
-			self.status_bar.update_message("Saved")
-
-	def action_reload_yaml(self) -> None:
-		self._load_yaml()
-
-	def action_format_yaml(self) -> None:
-		try:
-			data = yaml.safe_load(self.yaml_editor.text)
-		except yaml.YAMLError:
-			return
-		if data is None:
-			formatted = ""
-		else:
-			formatted = yaml.safe_dump(data, sort_keys=False)
-		self.yaml_editor.load_text(formatted)
-		self.status_bar.update_message("Formatted")
+			panel = Panel(message, title="Validation", border_style="red")
+			self._body.update(panel)
+			self.add_class("error")
+			self.scroll_home(animate=False)
+
+		def _truncate(self, text: str, notice: str) -> str:
+			"""Return text cut to MAX_PREVIEW_LINES lines, ending with notice if cut."""
+			lines = text.split("\n", self.MAX_PREVIEW_LINES)
+			if len(lines) <= self.MAX_PREVIEW_LINES:
+				return text
+			return "\n".join(lines[: self.MAX_PREVIEW_LINES]) + "\n" + notice
+
+
+	class YAMLValidated(Message):
+		"""Message emitted after validation run."""
+
+		# Message is fully slotted, so this avoids a per-message __dict__
+		__slots__ = ("success", "error")
+
+		def __init__(self, success: bool, error: Optional[Exception] = None) -> None:
+			self.success = success
+			self.error = error
+			super().__init__()
+
+
+	class YAMLEditorApp(App):
+		"""Main Textual application implementing the YAML editor demo."""
+
+		CSS = """
+		Screen {
+			layout: vertical;
+		}
+
+		Horizontal {
+			height: 1fr;
+		}
+
+		#content {
+			height: 1fr;
+		}
+
+		#editor {
+			border: solid green;
+			width: 1fr;
+			min-width: 40;
+			background: $surface-darken-2;
+			color: $text;
+		}
+
+		#preview {
+			border: solid blue;
+			padding: 1 2;
+			overflow: auto;
+			width: 1fr;
+			min-width: 40;
+			background: $surface-darken-1;
+		}
+
+		#preview.error {
+			border: solid $error;
+		}
+
+		#status-bar {
+			dock: bottom;
+			height: 1;
+			background: $surface;
+			color: $text-muted;
+		}
+
+		#status-bar Static {
+			padding: 0 1;
+		}
+		"""
+
+		TITLE = "YAML Editor Demo"
+		BINDINGS = [
+			Binding("ctrl+s", "save_yaml", "Save"),
+			Binding("ctrl+r", "reload_yaml", "Reload"),
+			Binding("ctrl+f", "format_yaml", "Format"),
+			Binding("ctrl+q", "quit", "Quit"),
+			Binding("f5", "validate_now", "Validate"),
+		]
+
+		preview_panel: PreviewPanel
+		yaml_editor: TextArea
+		status_bar: StatusBar
+
+		def __init__(self) -> None:
+			super().__init__()
+			# Hash of the last successfully validated buffer and its JSON rendering
+			self._last_text_hash: Optional[int] = None
+			self._last_json: Optional[str] = None
+			self._validate_timer: Optional[Timer] = None
+			# Text last written to YAML_FILE, and a lock so only one write is in flight
+			self._last_saved_text: Optional[str] = None
+			self._save_lock = asyncio.Lock()
+			# Text the app itself put in the editor: its Changed event is not a user edit
+			self._loaded_text: Optional[str] = None
+
+		def compose(self) -> ComposeResult:
+			yield Header()
+			yield MenuHintBar(id="menu-bar")
+			with Container(id="content"):
+				with Horizontal():
+					self.yaml_editor = TextArea(
+						language="yaml",
+						show_line_numbers=True,
+						theme="dracula",
+						id="editor",
+					)
+					yield self.yaml_editor
+					self.preview_panel = PreviewPanel(id="preview")
+					yield self.preview_panel
+			self.status_bar = StatusBar(id="status-bar")
+			yield self.status_bar
+			yield Footer()
+
+		async def on_mount(self) -> None:
+			if not _LIBYAML:
+				self.notify("libyaml not available, using the slow pure-Python YAML parser", severity="warning")
+			self._ensure_yaml_file()
+			await self._load_yaml()
+
+		async def on_text_area_changed(self, event: TextArea.Changed) -> None:
+			if event.text_area.text == self._loaded_text:
+				# Loaded, reloaded or formatted by the app: keep its status message and validation state
+				self._loaded_text = None
+				return
+			self._loaded_text = None
+			self._last_text_hash = None
+			self.status_bar.update_message("Modified (unsaved)")
+			self._schedule_validation()
+
+		def _schedule_validation(self) -> None:
+			# Debounce: restart the countdown so a burst of edits is validated once
+			if self._validate_timer is not None:
+				self._validate_timer.stop()
+			self._validate_timer = self.set_timer(VALIDATION_DELAY, self._validate_yaml, name="validator")
+
+		def _set_editor_text(self, text: str) -> None:
+			"""Replace the editor content, without it counting as a user edit."""
+			self._loaded_text = text
+			self.yaml_editor.load_text(text)
+
+		async def on_text_area_selection_changed(self, event: TextArea.SelectionChanged) -> None:
+			row, column = event.selection.end
+			self.status_bar.update_position(row, column)
+
+		def _ensure_yaml_file(self) -> None:
+			if not YAML_FILE.exists():
+				YAML_FILE.write_text("# Start editing YAML here\n", encoding="utf-8")
+
+		async def _load_yaml(self) -> None:
+			text = YAML_FILE.read_text(encoding="utf-8")
+			self._last_saved_text = text
+			self._set_editor_text(text)
+			self.status_bar.update_message("Loaded")
+			await self._validate_yaml()
+
+		async def _validate_yaml(self) -> None:
+			text = self.yaml_editor.text
+			text_hash = hash(text)
+			if text_hash == self._last_text_hash and self._last_json is not None:
+				# Buffer unchanged since the last valid run: skip parse and dump
+				self.preview_panel.show_json(self._last_json)
+				return
+			try:
+				parsed = yaml.load(text, Loader=_Loader) if text.strip() else None
+				json_output = _to_json(parsed) if parsed is not None else "null"
+				self._last_text_hash = text_hash
+				self._last_json = json_output
+				self.preview_panel.show_json(json_output)
+				self.status_bar.update_message("YAML valid")
+				await self.save_yaml(write_status=False)
+				self.post_message(YAMLValidated(True))
+			except Exception as error:  # pylint: disable=broad-except
+				self._last_text_hash = None
+				self.preview_panel.show_error(error)
+				self.status_bar.update_message("YAML invalid")
+				self.post_message(YAMLValidated(False, error))
+
+		async def action_save_yaml(self) -> None:
+			await self.save_yaml()
+
+		async def save_yaml(self, write_status: bool = True) -> None:
+			text = self.yaml_editor.text
+			async with self._save_lock:
+				# Skip the write when the file already holds this text
+				if text != self._last_saved_text:
+					loop = asyncio.get_running_loop()
+					await loop.run_in_executor(None, YAML_FILE.write_text, text, "utf-8")
+					self._last_saved_text = text
+			if write_status:
+				self.status_bar.update_message("Saved")
+
+		async def action_reload_yaml(self) -> None:
+			await self._load_yaml()
+
+		def action_format_yaml(self) -> None:
+			text = self.yaml_editor.text
+			try:
+				data = yaml.load(text, Loader=_Loader)
+			except yaml.YAMLError:
+				return
+			if data is None:
+				formatted = ""
+			else:
+				formatted = yaml.dump(data, Dumper=_Dumper, sort_keys=False)
+			if formatted == text:
+				# Reloading identical text would only reset the editor and revalidate
+				self.status_bar.update_message("Already formatted")
+				return
+			self._set_editor_text(formatted)
+			self.status_bar.update_message("Formatted")
+			self._schedule_validation()
+
+		def action_clear_yaml(self) -> None:
+			self._set_editor_text("")
+			self.status_bar.update_message("Cleared")
+			self._schedule_validation()
+
+		def action_show_about(self) -> None:
+			self.status_bar.update_message("Textual YAML Demo – https://textual.textualize.io")
+
+		async def action_validate_now(self) -> None:
+			await self._validate_yaml()
+
+	_ui = {
+		"MenuHintBar": MenuHintBar,
+		"StatusBar": StatusBar,
+		"PreviewPanel": PreviewPanel,
+		"YAMLValidated": YAMLValidated,
+		"YAMLEditorApp": YAMLEditorApp,
+	}
+	return _ui
+
 
-	def action_clear_yaml(self) -> None:
-		self.yaml_editor.load_text("")
-		self.status_bar.update_message("Cleared")
+def __getattr__(name: str) -> Any:
+	"""Expose the editor classes as module attributes, loading them lazily."""
+	if name in _UI_NAMES:
+		return _load_ui()[name]
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-	def action_show_about(self) -> None:
-		self.status_bar.update_message("Textual YAML Demo – https://textual.textualize.io")
 
-	def action_validate_now(self) -> None:
-		self._validate_yaml()
+def main() -> None:
+	"""Run the YAML editor demo."""
+	app: App = _load_ui()["YAMLEditorApp"]()
+	app.run()
 
 
 if __name__ == "__main__":
-	YAMLEditorApp().run()
+	main()
@@ -3,15 +3,18 @@ Reusable logging and print setup for all parts of the project.
 
 Functions:
     setup_logging      - Configure and return a logger.
+    stop_logging       - Flush pending log records and stop the logging thread.
     set_print_logger   - Set the logger for print_and_log and print_error.
     monkeypatch_print  - Replace built-in print with rich print.
     print_and_log      - Print and log an info message.
     print_error        - Print and log an error message.
 """
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 from typing import Optional
 import builtins
 from rich import print as rich_print
@@ -19,25 +22,33 @@ import sys
 
 # Module-level variable to hold the logger for print_and_log and print_error
 _print_logger = None
+# Background listener that writes the records queued by setup_logging
+_log_listener: Optional[logging.handlers.QueueListener] = None
 
 def setup_logging(app_name: str = "univor", daemon: bool = False, loglevel: int = logging.INFO, logfile: Optional[str] = None) -> logging.Logger:
     """
     Set up logging for the application.
     - If daemon=True, logs to syslog (Linux only).
     - Otherwise, logs to a file in ~/.<app_name>/log.txt or to a custom logfile.
+    Records are queued and written by a background thread, so logging calls
+    do not block on file or syslog I/O.
     Returns the configured logger.
+    Set the UNIVOR_DEBUG environment variable to print setup diagnostics to stderr.
     """
     logger = logging.getLogger()
     logger.setLevel(loglevel)
+    debug = bool(os.environ.get("UNIVOR_DEBUG"))  # print setup diagnostics to stderr
     from logging import Handler
     if daemon:
         # Remove %(asctime)s to avoid double timestamps in syslog
         formatter = logging.Formatter(f'%(levelname)s %(process)d [{app_name}] %(message)s')
         try:
             handler: Handler = logging.handlers.SysLogHandler(address='/dev/log')
-            print("[DEBUG] SysLogHandler set up for /dev/log", file=sys.stderr)
+            if debug:
+                print("[DEBUG] SysLogHandler set up for /dev/log", file=sys.stderr)
         except Exception as e:
-            print(f"[DEBUG] Failed to set up SysLogHandler: {e}", file=sys.stderr)
+            if debug:
+                print(f"[DEBUG] Failed to set up SysLogHandler: {e}", file=sys.stderr)
             handler = logging.StreamHandler()
     else:
         formatter = logging.Formatter('%(asctime)s %(levelname)s %(process)d %(message)s')
@@ -48,15 +59,33 @@ def setup_logging(app_name: str = "univor", daemon: bool = False, loglevel: int
         handler = logging.FileHandler(logfile)
 
     # Remove any existing handlers
-    for h in logger.handlers[:]:
-        logger.removeHandler(h)
+    stop_logging()
+    logger.handlers.clear()
 
+    global _log_listener
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _log_listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     set_print_logger(logger)
-    logger.info("[DEBUG] Logger initialized and test message from setup_logging.")
+    logger.debug("Logger initialized by setup_logging.")
     return logger
 
+def stop_logging():
+    """
+    Write any queued log records, stop the background logging thread and close its handlers.
+    Runs automatically at interpreter exit; call it explicitly before os._exit().
+    """
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+atexit.register(stop_logging)
+
 def set_print_logger(logger: logging.Logger):
     """
     Set the logger to be used by print_and_log and print_error.
@@ -64,7 +93,6 @@ def set_print_logger(logger: logging.Logger):
     """
     global _print_logger
     _print_logger = logger
-    #print(f"[DEBUG] set_print_logger called: logger={logger!r}", file=sys.stderr)
 
 def monkeypatch_print():
     """
@@ -80,10 +108,8 @@ def print_and_log(message: str, **kwargs):
     Print to console (via print) and log as info.
     """
     print(message, **kwargs)
-    #print(f"[DEBUG] print_and_log: _print_logger={_print_logger!r}", file=sys.stderr)
     if _print_logger is not None:
         _print_logger.info(message)
-        #print(f"[DEBUG] print_and_log: logged '{message}' to logger", file=sys.stderr)
 
 def print_error(message: str, **kwargs):
     """
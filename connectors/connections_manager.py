@@ -12,12 +12,37 @@ Reuses existing sessions when possible.
 
 """
 
-import uuid
-from common.app_setup import setup_logging
-from typing import Protocol
+import asyncio
+import weakref
+from typing import Callable
 
 from connectors.hypervisor_interface import HypervisorSessionProtocol
-from connectors.mock_hypervisor_connector import MockvisorSession
+
+######################### Hypervisor types #########################
+
+SessionFactory = Callable[[str, str, str], HypervisorSessionProtocol]
+# factory(host_URL, user, password) -> unconnected session
+
+_session_factories: dict[str, SessionFactory] = {}
+# key: hypervisor type name, as passed to get_session
+
+def register_hypervisor(hypervisor_type: str) -> Callable[[SessionFactory], SessionFactory]:
+    """
+    Decorator to register the session factory for a hypervisor type.
+    Connector modules should be imported inside the factory,
+    so they are only loaded when that hypervisor type is used.
+    """
+    def decorator(factory: SessionFactory) -> SessionFactory:
+        _session_factories[hypervisor_type] = factory
+        return factory
+    return decorator
+
+@register_hypervisor("mock_hypervisor")
+def _mockvisor_session(host_URL: str, user: str, password: str) -> HypervisorSessionProtocol:
+    from connectors.mock_hypervisor_connector import MockvisorSession
+    return MockvisorSession(host_URL, user, password)
+
+# Add other hypervisor types here as needed
 
 ######################### Sessions #########################
 
@@ -26,31 +51,41 @@ from connectors.mock_hypervisor_connector import MockvisorSession
 
 # variable to hold active sessions:
 
-_active_sessions: dict[tuple[str, str], 'HypervisorSessionProtocol'] = {}
-# key: (hostURL, user) tuple
-# value: HypervisorSessionProtocol instance
+_active_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[str, str], asyncio.Task[HypervisorSessionProtocol]]]" = weakref.WeakKeyDictionary()
+# key: event loop. Sessions hold async HTTP clients bound to the loop that created them,
+#   so each loop has its own sessions, and they are dropped with the loop
+# value: dict with
+#   key: (hostURL, user) tuple
+#   value: task connecting the HypervisorSessionProtocol instance, done once connected
 # This allows unique sessions per (hostURL, user) pair.
 
+async def _connect_session(hypervisor_type: str, host_URL: str, user: str, password: str) -> HypervisorSessionProtocol:
+    """Create a session based on hypervisor_type, and connect it."""
+    factory = _session_factories.get(hypervisor_type)
+    if factory is None:
+        raise ValueError(f"Unsupported hypervisor type: {hypervisor_type}")
+    session = factory(host_URL, user, password)
+    await session.connect()
+    return session
+
 # create a session. If a matching session already exists, return it.
-def get_session(hypervisor_type: str, host_URL: str, user: str, password: str) -> HypervisorSessionProtocol:
+async def get_session(hypervisor_type: str, host_URL: str, user: str, password: str) -> HypervisorSessionProtocol:
     """
     Get or create a hypervisor session for the given parameters.
-    Reuses existing sessions if one matches the (hostURL, user) pair.
+    Reuses existing sessions if one matches the (hostURL, user) pair in the running event loop.
+    Concurrent callers for the same pair wait for the same connection, while
+    other pairs connect in parallel.
     """
-    global _active_sessions
+    sessions = _active_sessions.setdefault(asyncio.get_running_loop(), {})
     key = (host_URL, user)
-    if key in _active_sessions:
-        return _active_sessions[key]
-        # by now, we do not erase sessions, even dead ones
-
-    # else:
-    # Create a new session based on hypervisor_type
-    if hypervisor_type == "mock_hypervisor":
-        session = MockvisorSession(host_URL, user, password)
-    # Add other hypervisor types here as needed
-    else:
-        raise ValueError(f"Unsupported hypervisor type: {hypervisor_type}")
-    
-    session.connect()
-    _active_sessions[key] = session
-    return session
\ No newline at end of file
+    connecting = sessions.get(key)
+    if connecting is None:
+        # no await between the lookup and the insertion, so only one task connects
+        connecting = sessions[key] = asyncio.ensure_future(_connect_session(hypervisor_type, host_URL, user, password))
+        # by now, we do not erase sessions, even dead ones. Failed connections are forgotten, so they are retried
+        def forget_failed(task: asyncio.Task) -> None:
+            if (task.cancelled() or task.exception() is not None) and sessions.get(key) is task:
+                del sessions[key]
+        connecting.add_done_callback(forget_failed)
+    # shield: a cancelled caller must not cancel the connection other callers wait for
+    return await asyncio.shield(connecting)
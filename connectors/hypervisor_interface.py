@@ -1,6 +1,8 @@
 from typing import Protocol, Any, List
 from box import Box  
 
+__all__ = ["VMConfig", "HypervisorSessionProtocol", "VMConnector", "HypervisorConnector"]
+
 class VMConfig(Box):
     """
     Protocol for VM configuration objects. Must be compatible with Box (dot-access dict).
@@ -18,19 +20,20 @@ class VMConfig(Box):
 class HypervisorSessionProtocol(Protocol):
     """Interface Protocol for hypervisor session objects.
     To be subclassed by actual session implementations.
+    Operations that talk to the hypervisor are coroutines.
     """
     @property
     def hypervisor_type(self) -> str: ...
-    @property
-    def is_alive(self) -> bool: ...
-    def connect(self): ...
-    def disconnect(self): ...   
+    async def is_alive(self) -> bool: ...
+    async def connect(self): ...
+    async def disconnect(self): ...   
 
 
 class VMConnector(Protocol):
     """
     Protocol for a Virtual Machine (VM) object.
     Implementations should provide properties and methods to represent and manage a VM.
+    Properties return the locally known state; the operations are coroutines.
     """
     def __init__(self, config: dict | str, hypervisor: "HypervisorConnector"):
         """
@@ -48,20 +51,20 @@ class VMConnector(Protocol):
     def status(self) -> str: ...
     @property
     def config(self) -> VMConfig: ...
-    def start(self) -> None: ...
-    def stop(self) -> None: ...
-    def pause(self) -> None: ...
-    def resume(self) -> None: ...
-    def delete(self) -> None: ...
-    def rename(self, new_name: str) -> None: ...
-    def reconfigure(self, config: VMConfig) -> None:
+    async def start(self) -> None: ...
+    async def stop(self) -> None: ...
+    async def pause(self) -> None: ...
+    async def resume(self) -> None: ...
+    async def delete(self) -> None: ...
+    async def rename(self, new_name: str) -> None: ...
+    async def reconfigure(self, config: VMConfig) -> None:
         """
         Replace the entire configuration of the VM with the provided config.
         All previous settings are lost unless included in the new config.
         """
         ...
 
-    def update_config(self, config: VMConfig) -> None:
+    async def update_config(self, config: VMConfig) -> None:
         """
         Merge the provided config with the current config, overwriting only the specified fields.
         Unspecified fields remain unchanged.
@@ -76,6 +79,7 @@ class HypervisorConnector(Protocol):
        Implementations must provide methods to manage VMs and interact with the hypervisor.
        Implementations must accept a HypervisorSessionProtocol instance upon initialization.
        The 'session' attribute must be an instance of HypervisorSessionProtocol.    
+       Methods that talk to the hypervisor are coroutines.
     """
     
     
@@ -85,15 +89,14 @@ class HypervisorConnector(Protocol):
               # In the implementation, initialize with a session object,
               # and store it as self.session.   
               
-    @property
-    def status(self) -> VMConfig: ...
-    "returns information about the hypervisor"
+    async def get_status(self, force: bool = False) -> dict[str, Any]: ...
+    "returns information about the hypervisor, possibly cached unless force is True"
     
-    def list_vms(self) -> List["VMConnector"]: ...
-    def get_vm(self, vm_id: str) -> "VMConnector": ...
-    def create_vm(self, config: VMConfig) -> "VMConnector": ...
-    def clone_vm(self, source_vm: "VMConnector", config: VMConfig) -> "VMConnector": ...
-    def search_vm(self, query: str) -> List["VMConnector"]: ...
+    async def list_vms(self) -> List["VMConnector"]: ...
+    async def get_vm(self, vm_id: str) -> "VMConnector": ...
+    async def create_vm(self, config: VMConfig) -> "VMConnector": ...
+    async def clone_vm(self, source_vm: "VMConnector", config: VMConfig) -> "VMConnector": ...
+    async def search_vm(self, query: str) -> List["VMConnector"]: ...
 
     @property
     def info(self) -> Box:
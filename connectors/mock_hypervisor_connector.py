@@ -3,19 +3,53 @@
 # hacer tests del connections manager . Añadir logs y verlos
 
 
+from functools import cached_property
 from typing import Any
+import json
+import time
 import uuid
+from urllib.parse import quote
 import httpx
 
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None  # type: ignore[assignment]
+
 from box import Box
 from connectors.hypervisor_interface import VMConfig, VMConnector, HypervisorConnector, HypervisorSessionProtocol
 
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Connection pool shared by all the requests of a session.
+# HTTP/2 is negotiated over TLS (https://), letting concurrent requests share one connection;
+# plain http:// hosts keep using pooled HTTP/1.1 keep-alive connections.
+_POOL_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60)
+
+
+def _dumps(payload: Any) -> bytes:
+    """ Serialize a request payload (VMConfig, list or dict) to a JSON body.
+    Box is a dict subclass, so it is encoded directly, without a dict() copy."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode()
+
+
+def _loads(body: bytes) -> Any:
+    """ Parse a JSON response body."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
 ##### Sessions #####
 class MockvisorSession(HypervisorSessionProtocol):
     """
     A mock hypervisor session implementation.
-    Uses REST API.
+    Uses REST API, asynchronously: all requests share one httpx.AsyncClient, so
+    connections are kept alive and reused, and many requests can be awaited concurrently.
+    Close it with disconnect(), or use the session as an async context manager.
 
     Args:
         host_URL (str): The base URL of the hypervisor.
@@ -28,52 +62,84 @@ class MockvisorSession(HypervisorSessionProtocol):
         self.base_URL = host_URL
         self.user = user
         self.password = password
-        self.session_id = str(uuid.uuid4())
-        self._client = httpx.Client(base_url=host_URL, auth=(user, password))
+        self._client = httpx.AsyncClient(base_url=host_URL, auth=(user, password),
+                                         http2=True, limits=_POOL_LIMITS)
 
-    def request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+    async def request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
         """
         Make an HTTP request to the hypervisor.
-        raise_for_status() is called on the response.
+        raise_for_status() is called on the response. The message of the HTTPStatusError
+        includes the error detail sent by the hypervisor.
 
         Args:
             method (str): The HTTP method (GET, POST, PUT, DELETE).
-            endpoint (str): The API endpoint (path) to call.
+            endpoint (str): The API endpoint (path) to call, relative to the base URL.
             **kwargs: Additional arguments to pass to httpx request.
-            example: session.request("GET", "/vms", params={"status": "running"})
+            example: await session.request("GET", "/vms", params={"status": "running"})
 
         Returns:
             httpx.Response: The HTTP response object.
         """
-        url = f"{self.base_URL}/{endpoint.lstrip('/')}"
-        response = self._client.request(method, url, **kwargs)
-        response.raise_for_status()
+        response = await self._client.request(method, endpoint, **kwargs)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise httpx.HTTPStatusError(f"{e}\n{response.text}", request=e.request, response=e.response) from None
         return response
 
+    async def json_request(self, method: str, endpoint: str, payload: Any = None) -> Any:
+        """
+        Make an HTTP request with an optional JSON payload, and return the parsed JSON response
+        (None for an empty response, e.g. 204 No Content).
+        Encoding and decoding use orjson when it is installed.
+
+        Args:
+            method (str): The HTTP method (GET, POST, PUT, PATCH, DELETE).
+            endpoint (str): The API endpoint (path) to call, relative to the base URL.
+            payload (Any): The request body, serialized to JSON. None sends no body.
+            example: vm = await session.json_request("POST", "/vms", {"name": "vm1"})
+        """
+        if payload is None:
+            response = await self.request(method, endpoint)
+        else:
+            response = await self.request(method, endpoint, content=_dumps(payload), headers=_JSON_HEADERS)
+        return _loads(response.content) if response.content else None
+
     @property
     def hypervisor_type(self) -> str:
         return "mock_hypervisor"
 
-    @property
-    def is_alive(self) -> bool:
+    @cached_property
+    def session_id(self) -> str:
+        """ Local identifier of the session, generated on first use.
+        mockvisor authenticates every request with HTTP Basic, so it is never sent."""
+        return str(uuid.uuid4())
+
+    async def is_alive(self) -> bool:
         """Check if the session is alive by making a test request to the hypervisor."""
         try:
-            resp = self.request("GET", "/status", timeout=2)
+            resp = await self.request("GET", "/status", timeout=2)
             return resp.status_code == 200
         except httpx.RequestError:
             return False
         
-    def connect(self):
+    async def connect(self):
         """Establish the session.
         For mockvisor, this may be a no-op if it does not use authentication tokens
         """
         # just check connection
-        if not self.is_alive:
+        if not await self.is_alive():
             raise ConnectionError(f"Cannot connect to hypervisor at {self.base_URL}")
 
-    def disconnect(self):
-        """Disconnect the session. For mockvisor, this may be a no-op."""
-        self._client.close()
+    async def disconnect(self):
+        """Disconnect the session, closing the pooled HTTP connections."""
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "MockvisorSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.disconnect()
              
 
 
@@ -92,6 +158,7 @@ class MockVMConnector(VMConnector):
     def __init__(self, config: dict | str, hypervisor: "MockHypervisorConnector"):
         self._config = VMConfig(config)
         self.hypervisor: MockHypervisorConnector = hypervisor
+        self._base_path = f"/vms/{quote(self._config.id, safe='')}"  # the id never changes
 
     @property
     def id(self) -> str:
@@ -109,99 +176,144 @@ class MockVMConnector(VMConnector):
     def config(self) -> VMConfig:
         return self._config  # type: ignore
 
-    def start(self) -> None:
-        self._lifecycle_action("start")
+    async def start(self) -> None:
+        await self._lifecycle_action("start")
 
-    def stop(self) -> None:
-        self._lifecycle_action("stop")
+    async def stop(self) -> None:
+        await self._lifecycle_action("stop")
 
-    def pause(self) -> None:
-        self._lifecycle_action("pause")
+    async def pause(self) -> None:
+        await self._lifecycle_action("pause")
 
-    def resume(self) -> None:
-        self._lifecycle_action("resume")
+    async def resume(self) -> None:
+        await self._lifecycle_action("resume")
 
-    def delete(self) -> None:
-        r= self.hypervisor.request("DELETE", f"/vms/{self.id}")
-        r.raise_for_status()
+    async def delete(self) -> None:
+        await self.hypervisor.request("DELETE", self._base_path)
 
-    def rename(self, new_name: str) -> None:
-        ur= self.hypervisor.request("PUT", f"/vms/{self.id}", json={"name": new_name})
+    async def rename(self, new_name: str) -> None:
+        await self.hypervisor.json_request("PUT", self._base_path, {"name": new_name})
         self._config.name = new_name
 
-    def reconfigure(self, config: VMConfig) -> None:
+    async def reconfigure(self, config: VMConfig | dict) -> None:
         """ Update the entire VM configuration
         the new id must be the same as the old one"""
-        if config.id != self.id:
+        config = VMConfig(config)
+        if config.get("id") != self.id:
             raise ValueError("VM ID cannot be changed")
         
-        r = self.hypervisor.request("PUT", f"/vms/{self.id}", json=dict(config))
-        self._config = config
+        info = await self.hypervisor.json_request("PUT", self._base_path, config)
+        self._config = VMConfig(info)
 
-    def update_config(self, config: VMConfig) -> None:
+    async def update_config(self, config: VMConfig | dict) -> None:
         """patch the VM configuration
         Merge the provided config with the current config, 
         overwriting only the specified fields.
         The new id must be the same as the old one"""
-        if config.id is not None and config.id != self.id:
+        if config.get("id") is not None and config["id"] != self.id:
             raise ValueError("VM ID cannot be changed")
 
-        r = self.hypervisor.request("PATCH", f"/vms/{self.id}", json=dict(config))
-        self._config.update(config)
+        # mockvisor PUT only changes the fields sent
+        info = await self.hypervisor.json_request("PUT", self._base_path, config)
+        self._config.update(info)
 
 
     def list_devices(self) -> list[Any]:
         # Not implemented in mockvisor
         return []
 
-    def _lifecycle_action(self, action: str):
-        r= self.hypervisor.request("POST", f"/vms/{self.id}/{action}")
-        self._config.status = r.json().get("status", self._config.status)
+    async def _lifecycle_action(self, action: str):
+        info = await self.hypervisor.json_request("POST", f"{self._base_path}/{action}")
+        self._config.status = info.get("status", self._config.status)
 
 
 class MockHypervisorConnector(HypervisorConnector):
     """ A mock hypervisor connector implementation.
-    Uses REST API."""
+    Uses REST API. All the methods doing requests are coroutines."""
+
+    STATUS_TTL = 1.0  # seconds a fetched status is reused
 
     def __init__(self, session: MockvisorSession):
         self.session: MockvisorSession = session
-        self.request = self.session.request  # "alias" Now self.request(...) is the same as self.session.request(...)
+        self._status_cache: tuple[float, dict[str, Any]] | None = None  # (monotonic timestamp, status)
 
-        
-    @property
-    def status(self) -> VMConfig:
-        r = self.request("GET", "/status")
-        return VMConfig(r.json())
+    async def request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        """Same as self.session.request(...)"""
+        return await self.session.request(method, endpoint, **kwargs)
 
-    @property
+    async def json_request(self, method: str, endpoint: str, payload: Any = None) -> Any:
+        """Same as self.session.json_request(...)"""
+        return await self.session.json_request(method, endpoint, payload)
+
+    async def close(self) -> None:
+        """Close the underlying session and its HTTP connection pool."""
+        await self.session.disconnect()
+
+    async def __aenter__(self) -> "MockHypervisorConnector":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+        
+    async def get_status(self, force: bool = False) -> dict[str, Any]:
+        """ Returns the hypervisor status, as the parsed JSON dict.
+        The result is reused for STATUS_TTL seconds, unless force is True."""
+        now = time.monotonic()
+        if not force and self._status_cache is not None:
+            fetched_at, status = self._status_cache
+            if now - fetched_at < self.STATUS_TTL:
+                return status
+        status = await self.json_request("GET", "/status")
+        self._status_cache = (now, status)
+        return status
+
+    @cached_property
     def info(self) -> Box:
         """ Returns information about the connector,
             such as type, version, and capabilities, as a Box.
+            Built once: it only depends on the session settings.
+            The Box is frozen, as the same instance is returned to every caller.
         """
         return Box({
             "type": "mock_hypervisor",
             "hostURL": self.session.base_URL,
             "user": self.session.user
-        })
-
-    def list_vms(self) -> list[VMConnector]:
-        r = self.request("GET", "/vms")
-        return [MockVMConnector(vm, self) for vm in r.json()]
-
-    def get_vm(self, vm_id: str) -> VMConnector:
-        r= self.request("GET", f"/vms/{vm_id}")
-        return MockVMConnector(r.json(), self)
-
-    def create_vm(self, config: VMConfig) -> VMConnector:
-        r= self.request("POST", "/vms", json=dict(config))
-        return MockVMConnector(r.json(), self)
-
-    def clone_vm(self, source_vm: VMConnector, config: VMConfig) -> VMConnector:
-        r = self.request("POST", f"/vms/{source_vm.id}/clone", json=dict(config))
-        return MockVMConnector(r.json(), self)
-
-    def search_vm(self, query: str) -> list[VMConnector]:
-        r = self.request("GET", f"/vms?search={query}")
-        r.raise_for_status()
-        return [MockVMConnector(vm, self) for vm in r.json()]
+        }, frozen_box=True)
+
+    async def list_vms(self) -> list[VMConnector]:
+        """ List all VMs. mockvisor returns each VM's full info (status, cpu, memory...),
+        so the returned connectors need no follow-up get_vm() to read their properties."""
+        vms = await self.json_request("GET", "/vms")
+        return [MockVMConnector(vm, self) for vm in vms]
+
+    async def get_vm(self, vm_id: str) -> VMConnector:
+        return MockVMConnector(await self.json_request("GET", f"/vms/{quote(vm_id, safe='')}"), self)
+
+    async def create_vm(self, config: VMConfig) -> VMConnector:
+        return MockVMConnector(await self.json_request("POST", "/vms", config), self)
+
+    async def clone_vm(self, source_vm: VMConnector, config: VMConfig) -> VMConnector:
+        return MockVMConnector(await self.json_request("POST", f"/vms/{quote(source_vm.id, safe='')}/clone", config), self)
+
+    async def create_vms(self, configs: list[VMConfig]) -> list[VMConnector]:
+        """ Create several VMs with a single request.
+        If any config is rejected, no VM is created."""
+        vms = await self.json_request("POST", "/vms:batch", configs)
+        return [MockVMConnector(vm, self) for vm in vms]
+
+    async def delete_vms(self, vms: list[MockVMConnector]) -> None:
+        """ Delete several VMs with a single request."""
+        await self.json_request("POST", "/vms:batch-delete", {"ids": [vm.id for vm in vms]})
+
+    async def lifecycle_many(self, vms: list[MockVMConnector], action: str) -> None:
+        """ Apply a lifecycle action (start, stop, pause, resume) to several VMs
+        with a single request, and update their status."""
+        infos = await self.json_request("POST", "/vms:batch-action", {"ids": [vm.id for vm in vms], "action": action})
+        for vm, info in zip(vms, infos):
+            vm._config.status = info.get("status", vm._config.status)
+
+    async def search_vm(self, query: str) -> list[VMConnector]:
+        r = await self.request("GET", "/vms", params={"search": query})
+        return [MockVMConnector(vm, self) for vm in _loads(r.content)]
 
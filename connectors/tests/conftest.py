@@ -0,0 +1,57 @@
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+import pytest
+
+from mock_hypervisor import launcher
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: sessions are not serialized, see _start_lock
+    fcntl = None  # type: ignore[assignment]
+
+# Serializes the start-up between concurrent pytest sessions on this machine,
+# so they don't start two daemons.
+LOCK_FILE = Path(tempfile.gettempdir()) / "mockvisor.lock"
+
+
+@contextmanager
+def _start_lock():
+    """Hold an exclusive lock on LOCK_FILE, where flock is available."""
+    with open(LOCK_FILE, "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _is_mockvisor(port: int) -> bool:
+    """Is a mockvisor daemon answering on the port? Checks /status, not just that something listens."""
+    try:
+        resp = httpx.get(f"http://127.0.0.1:{port}/status", timeout=2)
+        return resp.status_code == 200 and resp.json().get("status") == "ok"
+    except (httpx.HTTPError, ValueError):
+        return False
+
+
+@pytest.fixture(scope="session")
+def mockvisor_port():
+    """
+    Yield the port of a running mockvisor daemon.
+    A daemon already running (e.g. for another session) is reused and left running.
+    Otherwise one is started through the launcher, and stopped at the end of the session.
+    """
+    with _start_lock():
+        result = launcher.start_daemon()
+        started = result["msg"] == "Started daemon"
+        port = result["port"]
+        if port == "unknown" or not _is_mockvisor(int(port)):
+            raise RuntimeError(f"mockvisor is not answering on its port: {result}")
+    yield int(port)
+    if started:
+        launcher.stop_daemon()
@@ -1,177 +1,215 @@
 
 
-import subprocess
-import time
+import asyncio
+import uuid
 import pytest
-from connectors.mock_hypervisor_connector import MockHypervisorConnector
-
-
-@pytest.fixture(scope="session")
-def mockvisor_port():
-    """
-    Always start a new mockvisor daemon for tests using the launcher CLI, and yield the detected port. Shut down after tests.
-    """
-    import json
-    import sys
-    proc = subprocess.run([
-        sys.executable, "-m", "mock_hypervisor.launcher", "start"
-    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    print("[DEBUG] launcher raw stdout:")
-    print(repr(proc.stdout))
-    # Extract the first valid JSON line from stdout
-    json_line = None
-    for line in proc.stdout.splitlines():
-        line = line.strip()
-        if line.startswith('{') and line.endswith('}'): 
-            json_line = line
-            break
-    if not json_line:
-        print("[DEBUG] mockvisor_port stderr output:")
-        print(proc.stderr)
-        print("[DEBUG] mockvisor_port stdout output:")
-        print(proc.stdout)
-        raise RuntimeError("mockvisor did not start via launcher (no port in output)")
-    data = json.loads(json_line)
-    port = int(data["port"])
-    yield port
-    # Do not stop the daemon after tests; leave it running
-
-@pytest.fixture
-def connector(mockvisor_port):
-    return MockHypervisorConnector(host="127.0.0.1", user="user", password="pass", port=mockvisor_port)
-
-def test_create_vm(connector):
-    config = {"name": "testvm", "cpu": 2, "memory": 2048}
-    vm = connector.create_vm(config)
-    assert vm.name == "testvm"
+import pytest_asyncio
+from connectors.mock_hypervisor_connector import MockHypervisorConnector, MockvisorSession
+
+# The connector API is async: every test runs in an event loop
+pytestmark = pytest.mark.asyncio
+
+
+def unique(name: str) -> str:
+    """Make a VM name unique: the daemon is shared across test sessions and keeps the VMs they create."""
+    return f"{name}-{uuid.uuid4().hex[:8]}"
+
+
+@pytest_asyncio.fixture
+async def connector(mockvisor_port):
+    session = MockvisorSession(f"http://127.0.0.1:{mockvisor_port}", "user", "pass")
+    async with MockHypervisorConnector(session) as connector:
+        yield connector
+
+@pytest_asyncio.fixture
+async def many_vms(connector):
+    """Create several VMs concurrently: setup costs one round trip, not one per VM."""
+    configs = [{"name": unique(f"many{i}"), "cpu": 1, "memory": 512} for i in range(8)]
+    vms = await asyncio.gather(*(connector.create_vm(c) for c in configs))
+    yield vms
+    await connector.delete_vms(vms)
+
+async def test_create_vm(connector):
+    name = unique("testvm")
+    config = {"name": name, "cpu": 2, "memory": 2048}
+    vm = await connector.create_vm(config)
+    assert vm.name == name
     assert vm.config["cpu"] == 2
     assert vm.config["memory"] == 2048
 
-def test_list_and_get_vm(connector):
-    config = {"name": "listme", "cpu": 1, "memory": 1024}
-    vm = connector.create_vm(config)
-    vms = connector.list_vms()
-    assert any(v.name == "listme" for v in vms)
-    got = connector.get_vm(vm.id)
-    assert got.name == "listme"
-
-def test_update_and_rename_vm(connector):
-    config = {"name": "updateme", "cpu": 1, "memory": 1024}
-    vm = connector.create_vm(config)
-    vm.rename("updatedname")
-    assert vm.name == "updatedname"
+async def test_list_and_get_vm(connector):
+    name = unique("listme")
+    config = {"name": name, "cpu": 1, "memory": 1024}
+    vm = await connector.create_vm(config)
+    vms = await connector.list_vms()
+    assert any(v.name == name for v in vms)
+    # The listing is already hydrated: no get_vm() needed to read the config
+    listed = next(v for v in vms if v.id == vm.id)
+    assert listed.status == "stopped"
+    assert listed.config["cpu"] == 1 and listed.config["memory"] == 1024
+    got = await connector.get_vm(vm.id)
+    assert got.name == name
+
+async def test_concurrent_vm_operations(connector, many_vms):
+    ids = {v.id for v in await connector.list_vms()}
+    assert all(vm.id in ids for vm in many_vms)
+    await asyncio.gather(*(vm.start() for vm in many_vms))
+    assert all(vm.status == "running" for vm in many_vms)
+    got = await asyncio.gather(*(connector.get_vm(vm.id) for vm in many_vms))
+    assert [vm.name for vm in got] == [vm.name for vm in many_vms]
+
+async def test_update_and_rename_vm(connector):
+    config = {"name": unique("updateme"), "cpu": 1, "memory": 1024}
+    vm = await connector.create_vm(config)
+    new_name = unique("updatedname")
+    await vm.rename(new_name)
+    assert vm.name == new_name
     new_config = {"cpu": 4, "memory": 4096}
-    vm.update_config(new_config)
+    await vm.update_config(new_config)
     assert vm.config["cpu"] == 4
     assert vm.config["memory"] == 4096
 
-def test_clone_and_lifecycle(connector):
-    config = {"name": "cloneme", "cpu": 2, "memory": 2048}
-    vm = connector.create_vm(config)
-    clone_config = {"name": "clone1"}
-    clone = connector.clone_vm(vm, clone_config)
-    assert clone.name == "clone1"
-    clone.start()
+async def test_clone_and_lifecycle(connector):
+    config = {"name": unique("cloneme"), "cpu": 2, "memory": 2048}
+    vm = await connector.create_vm(config)
+    clone_config = {"name": unique("clone1")}
+    clone = await connector.clone_vm(vm, clone_config)
+    assert clone.name == clone_config["name"]
+    await clone.start()
     assert clone.status == "running"
-    clone.pause()
+    await clone.pause()
     assert clone.status == "paused"
-    clone.resume()
+    await clone.resume()
     assert clone.status == "running"
-    clone.stop()
+    await clone.stop()
     assert clone.status == "stopped"
 
-def test_delete_vm(connector):
-    config = {"name": "deleteme", "cpu": 1, "memory": 1024}
-    vm = connector.create_vm(config)
+async def test_delete_vm(connector):
+    config = {"name": unique("deleteme"), "cpu": 1, "memory": 1024}
+    vm = await connector.create_vm(config)
     vm_id = vm.id
-    vm.delete()
-    vms = connector.list_vms()
+    await vm.delete()
+    vms = await connector.list_vms()
     assert all(v.id != vm_id for v in vms)
 
 
-def test_create_vm_invalid(connector):
+async def test_create_vm_invalid(connector):
     import httpx
     # Missing name
     config = {"cpu": 2, "memory": 2048}
     with pytest.raises(httpx.HTTPStatusError):
-        connector.create_vm(config)
+        await connector.create_vm(config)
     # Name is empty
     config = {"name": "", "cpu": 2, "memory": 2048}
     with pytest.raises(httpx.HTTPStatusError):
-        connector.create_vm(config)
-
-def test_create_vm_duplicate_name(connector):
-    config = {"name": "dupe", "cpu": 1, "memory": 512}
-    vm1 = connector.create_vm(config)
-    vm2 = connector.create_vm(config)
-    print(f"vm1.name: {vm1.name}")
-    print(f"vm2.name: {vm2.name}")
-    assert vm1.name.startswith("dupe")
-    assert vm2.name.startswith("dupe")
-    assert vm1.name != vm2.name
-
-def test_create_vm_edge_cases(connector):
+        await connector.create_vm(config)
+
+async def test_create_vm_duplicate_name(connector):
+    import httpx
+    config = {"name": unique("dupe"), "cpu": 1, "memory": 512}
+    vm = await connector.create_vm(config)
+    assert vm.name == config["name"]
+    # The name is taken: the hypervisor rejects a second VM with it
+    with pytest.raises(httpx.HTTPStatusError) as excinfo:
+        await connector.create_vm(config)
+    assert excinfo.value.response.status_code == 409
+
+async def test_create_vm_edge_cases(connector):
     # Extremely large values
-    config = {"name": "bigvm", "cpu": 128, "memory": 1048576}
-    vm = connector.create_vm(config)
+    config = {"name": unique("bigvm"), "cpu": 128, "memory": 1048576}
+    vm = await connector.create_vm(config)
     assert vm.config["cpu"] == 128
     assert vm.config["memory"] == 1048576
     # Extremely small values
-    config = {"name": "smallvm", "cpu": 1, "memory": 1}
-    vm = connector.create_vm(config)
+    config = {"name": unique("smallvm"), "cpu": 1, "memory": 1}
+    vm = await connector.create_vm(config)
     assert vm.config["cpu"] == 1
     assert vm.config["memory"] == 1
     # Invalid type
-    config = {"name": "badtype", "cpu": "two", "memory": 1024}
+    config = {"name": unique("badtype"), "cpu": "two", "memory": 1024}
     with pytest.raises(Exception) as excinfo:
-        connector.create_vm(config)
+        await connector.create_vm(config)
     assert "cpu" in str(excinfo.value)
 
-def test_lifecycle_transitions(connector):
-    config = {"name": "transitvm", "cpu": 2, "memory": 2048}
-    vm = connector.create_vm(config)
+async def test_lifecycle_transitions(connector):
+    config = {"name": unique("transitvm"), "cpu": 2, "memory": 2048}
+    vm = await connector.create_vm(config)
     # Initial status
     assert vm.status == "stopped"
     # Start
-    vm.start()
+    await vm.start()
     assert vm.status == "running"
     # Pause
-    vm.pause()
+    await vm.pause()
     assert vm.status == "paused"
     # Resume
-    vm.resume()
+    await vm.resume()
     assert vm.status == "running"
     # Stop
-    vm.stop()
+    await vm.stop()
     assert vm.status == "stopped"
     # Invalid transition: pause when stopped
     with pytest.raises(Exception) as excinfo:
-        vm.pause()
+        await vm.pause()
     assert "cannot" in str(excinfo.value).lower() or "invalid" in str(excinfo.value).lower()
 
-def test_invalid_lifecycle_action(connector):
-    config = {"name": "badlife", "cpu": 1, "memory": 1024}
-    vm = connector.create_vm(config)
+async def test_invalid_lifecycle_action(connector):
+    config = {"name": unique("badlife"), "cpu": 1, "memory": 1024}
+    vm = await connector.create_vm(config)
     # Try an invalid lifecycle action if supported
     if hasattr(vm, "lifecycle_action"):
         with pytest.raises(Exception) as excinfo:
-            vm.lifecycle_action("invalid_action")
+            await vm.lifecycle_action("invalid_action")
         assert "invalid" in str(excinfo.value).lower()
 
-def test_update_vm_invalid(connector):
-    config = {"name": "badupdate", "cpu": 1, "memory": 1024}
-    vm = connector.create_vm(config)
+async def test_update_vm_invalid(connector):
+    config = {"name": unique("badupdate"), "cpu": 1, "memory": 1024}
+    vm = await connector.create_vm(config)
     # Update with empty name
     with pytest.raises(Exception):
-        vm.update_config({"name": ""})
+        await vm.update_config({"name": ""})
     # Update with missing name (if required)
     # This depends on your API; skip if not enforced
 
-def test_lifecycle_invalid_action(connector):
-    config = {"name": "badlife", "cpu": 1, "memory": 1024}
-    vm = connector.create_vm(config)
+async def test_lifecycle_invalid_action(connector):
+    config = {"name": unique("badlife"), "cpu": 1, "memory": 1024}
+    vm = await connector.create_vm(config)
     # Try an invalid lifecycle action (simulate via connector if possible)
     # If connector exposes a generic action method, use it; else, skip
     # Example (pseudo):
     # with pytest.raises(Exception):
-    #     vm.lifecycle_action("invalid")
\ No newline at end of file
+    #     await vm.lifecycle_action("invalid")
+
+async def test_batch_create_lifecycle_delete(connector):
+    configs = [{"name": unique(f"batch{i}"), "cpu": 1, "memory": 512} for i in range(3)]
+    vms = await connector.create_vms(configs)
+    assert [vm.name for vm in vms] == [c["name"] for c in configs]
+    await connector.lifecycle_many(vms, "start")
+    assert all(vm.status == "running" for vm in vms)
+    await connector.delete_vms(vms)
+    ids = {v.id for v in await connector.list_vms()}
+    assert all(vm.id not in ids for vm in vms)
+
+async def test_batch_create_is_all_or_nothing(connector):
+    import httpx
+    configs = [{"name": unique("batchok"), "cpu": 1, "memory": 512}, {"name": "", "cpu": 1, "memory": 512}]
+    with pytest.raises(httpx.HTTPStatusError):
+        await connector.create_vms(configs)
+    assert not await connector.search_vm(configs[0]["name"])
+
+
+async def test_status_is_cached(connector):
+    status = await connector.get_status()
+    assert status["status"] == "ok"
+    assert await connector.get_status() is status
+    assert await connector.get_status(force=True) is not status
+    assert connector.info is connector.info
+    assert connector.info.type == connector.info["type"] == "mock_hypervisor"
+    with pytest.raises(Exception):
+        connector.info.user = "someone else"
+
+async def test_search_vm_query_is_encoded(connector):
+    vm = await connector.create_vm({"name": unique("find me&"), "cpu": 1, "memory": 512})
+    found = await connector.search_vm(vm.name)
+    assert [v.id for v in found] == [vm.id]
+    await vm.delete()
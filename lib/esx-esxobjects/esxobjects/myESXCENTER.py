@@ -5,52 +5,97 @@
 import logging
 mylogger = logging.getLogger()
 
-from typing import Callable, MutableSequence, Optional, List, Tuple
-from .myESXSERVER import myESXSERVER
+from typing import Callable, Dict, Iterator, Optional, List, Tuple
+from .myESXSERVER import myESXSERVER, _compilePattern
 from .myESXVM import myESXVM
 from .myESXError import myESXError, myESXWarning
 
-import os, getpass
+import os, sys, getpass, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def _getenv(name:str, default:str = "") -> str:
+    """Read a non-secret environment variable once and remember its value.
+    Never use it for MYESX_PASSWORD: the cache would keep the password for the life of the process.
+    Call `_getenv.cache_clear()` after changing the environment to read it again.
+    """
+    return os.getenv(name, default)
 
 class myESXCENTER:
     """
     Class to handle a set of standalone ESX servers
+
+    Use it as a context manager to disconnect all the servers deterministically when done::
+
+        with myESXCENTER() as center:
+            center.connect_servers()
+            ...
     """
     def __init__(self):
         """Create an empty ESXCENTER object and read connection parameters from environment if possible."""
-        self.serverList:MutableSequence[myESXSERVER] = []
+        # Connected servers by hostname, in connection order: constant time lookup and removal
+        self._serversByName:Dict[str, myESXSERVER] = {}
+        # Protects _serversByName when servers are connected or disconnected from several threads
+        self._serversLock = threading.Lock()
+        # (user, password) that connected some host, reused by later connect_servers() calls
+        # instead of prompting again. Forgotten by disconnect_allservers().
+        self._cachedPassword:Optional[Tuple[str, str]] = None
 
-        # Get list of hosts from environment
-        hostnames = os.getenv("MYESX_HOSTS","")
-        if hostnames:
-            self.hostnames = hostnames.split(":")
+        # Get list of hosts from environment, parsed once and reused by connect_servers()
+        self.hostnames:List[str] = [h for h in _getenv("MYESX_HOSTS","").split(":") if h]
         # Get username from environment
-        self.user = os.getenv("MYESX_USER", "root")
+        self.user = _getenv("MYESX_USER", "root")
         # Get cacert from environment
-        self.cacert = os.getenv("MYESX_CACERT","NONE")
+        self.cacert = _getenv("MYESX_CACERT","NONE")
+
+    def __enter__(self) -> "myESXCENTER":
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close connections to all ESX hosts when leaving the with block."""
+        self.disconnect_allservers()
 
     def __del__(self):
         """
-        Close connections to all ESX hosts at the time of deleting this object.
+        Best-effort fallback closing the connections still open at the time of deleting this object.
+        Prefer the context manager: at garbage collection time errors can only be ignored.
         """
-        self.disconnect_allservers()
+        try:
+            if self._serversByName:
+                self.disconnect_allservers()
+        except Exception:
+            pass
 
-    def _addESX(self, hostname: str, user:str, password:str, cacert:str, keepaliveinterval:int):
+    def _addESX(self, hostname: str, user:str, password:str, cacert:str, keepaliveinterval:int) -> bool:
         """Open a connection to an ESX and add it to the list.
         :param hostname: The hostname of the server to be connected.
         :param user: The username to be user to connect the ESX API.
         :param password: The password of the user to connect the ESX API.
         :param cacert: The path of a PEM file containing the certificate of the signing CA of the ESX server certiificate.
         :param keepaliveinterval: The number of seconds between pings to keep the connection alive.
-
-        ERRORS:
-        - 
+        :return: True if the host is connected, False if the connection failed. The reason is logged.
+            A host which is already connected keeps its existing connection.
         """
+        if hostname in self._serversByName:
+            mylogger.info('Already connected to %s', hostname)
+            return True
         try:
-            self.serverList.append( myESXSERVER(hostname, user, cacert, password, keepalive=keepaliveinterval) )
-            mylogger.info(f'Connected to {hostname}')
+            server = myESXSERVER(hostname, user, cacert, password, keepalive=keepaliveinterval)
         except myESXError as e:
-            raise myESXError(f'Error adding ESX host {hostname}: {e.message}: {e.message}')
+            mylogger.error('Error adding ESX host %s: %s', hostname, e.message)
+            return False
+        with self._serversLock:
+            # Another thread may have connected the same host meanwhile: keep the first connection
+            duplicate = hostname in self._serversByName
+            if not duplicate:
+                self._serversByName[hostname] = server
+        if duplicate:
+            server.disconnect()
+            mylogger.info('Already connected to %s', hostname)
+        else:
+            mylogger.info('Connected to %s', hostname)
+        return True
 
     def _delESX(self, server:myESXSERVER):
         """
@@ -61,10 +106,11 @@ class myESXCENTER:
         """
         try:
             server.disconnect()
-            mylogger.info("Disconnected from " + server.getName())
-            self.serverList.remove( server )
+            mylogger.info('Disconnected from %s', server.getName())
+            with self._serversLock:
+                self._serversByName.pop(server.getName(), None)
         except myESXError as e:
-            raise myESXError(f'Error closing connection to ESX host {server.getName()}: {e.message}: {e.message}')
+            raise myESXError(f'Error closing connection to ESX host {server.getName()}: {e.message}')
 
     def _getpassword(self) -> str:
         """Read a string from console disabling terminal echo for privacy.
@@ -92,9 +138,11 @@ class myESXCENTER:
 
         :param hostnames: This is a list of strings containing the hostnames of the servers to connect. If the list if empty, then a string containing a list of hostname separated by ':' is read from the environment variable MYESX_HOSTS. If the variable is not found, the default is an empty list of hostnames.
         :param user: This is the username used to connect the ESX server API. The operations available are restricted by the permissions of this account. If the parameter has the value None (Python null value), then it is read from the environment variable MYESX_USER. If the variable does not exists, the default value is 'root'.
-        :param password: This is the password used to connect the ESX server API. If the value is None (Python null value), then it is read from the environment variable MYESX_PASSWORD. If the variable does not exist, then it is interactively read from the console.
+        :param password: This is the password used to connect the ESX server API. If the value is None (Python null value), then it is read from the environment variable MYESX_PASSWORD. If the variable does not exist, the password that connected some host in a previous call for the same user is reused. Otherwise it is interactively read from the console.
         :param cacert: This is the path of a PEM file containing the CA certificate signing the server certificate. This is used to validate such certificate during connection. If your server uses a self signed certificate, use the value "NONE" for this parameters. If the parameter is None (null value in Python), the environment variable MYESX_CACERT is read. If it does not exists, the default value is the string "NONE".
-        :param keepaliveinterval: The number of seconds between pings to keep the connection alive.
+        :param keepaliveinterval: The number of seconds between pings to keep the connection alive. Unlike a standalone myESXSERVER,
+            whose keepalive is 0 by default, the servers of a center are long-lived and may stay idle between calls, so they are pinged
+            every DEFAULT_KEEPALIVE_INTERVAL seconds by default. 0 disables the pings.
 
         :raises myESXError: Is generated if interactive password reading is interrupted or an empty string is given.
         :raises myESXError: Is raise if no hosts were connected.
@@ -107,28 +155,33 @@ class myESXCENTER:
             user = self.user
         if not cacert:
             cacert = self.cacert
-        # Get password from environment and replace it by argument if not null
+        # Get password from environment and replace it by argument if not null.
+        # Read directly, not through _getenv, so it is not cached
         if not password:
             password = os.getenv("MYESX_PASSWORD","")
+        # Reuse the password that worked in a previous call for the same user
+        if not password and self._cachedPassword is not None and self._cachedPassword[0] == user:
+            password = self._cachedPassword[1]
         # Read password from console if null
-                # Get cacert from environment
         if not password:
             password = self._getpassword()
 
         if not password:
             raise myESXError("Empty password. Can't connect to any server.")
 
-        # Connect all hosts
+        # Connect all hosts concurrently: each connection is dominated by the network round trips
         failed:List[str] = []
-        for host in hostnames:
-            try:
-                self._addESX(host, user, password, cacert, keepaliveinterval)
-            except myESXError as e:
-                failed.append(host)
+        with ThreadPoolExecutor(max_workers=max(1, min(32, len(hostnames)))) as ex:
+            futures = {ex.submit(self._addESX, host, user, password, cacert, keepaliveinterval): host for host in hostnames}
+            for future in as_completed(futures):
+                if not future.result():
+                    failed.append(futures[future])
 
         # Check if we connected some host
-        if self.serverList == []:
+        if not self._serversByName:
             raise myESXError(f'No host was connected.')
+        if len(failed) < len(hostnames):
+            self._cachedPassword = (user, password)
         # Check if any host failed
         if failed != []:
             raise myESXWarning(f'Connection failed to the following hosts: {failed}')
@@ -139,18 +192,36 @@ class myESXCENTER:
 
         :raises myESXError: Raised when an exception was received while disconnecting any ESX server.
         """
+        self._cachedPassword = None
         failed:List[myESXSERVER] = []
-        # Make a copy of the list to avoid iterator problems with removal of list
-        for server in [s for s in self.serverList]:
-            try:
-                self._delESX(server)
-            except myESXError as e:
-                failed.append(server)
-
-        if self.serverList != []:
+        # Disconnect all servers concurrently, iterating on a snapshot
+        # because _delESX removes each disconnected server
+        servers = list(self._serversByName.values())
+        if sys.is_finalizing():
+            # No new threads can be started while the interpreter exits (e.g. when called from __del__)
+            for server in servers:
+                try:
+                    self._delESX(server)
+                except myESXError as e:
+                    failed.append(server)
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(32, len(servers)))) as ex:
+                futures = {ex.submit(self._delESX, server): server for server in servers}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except myESXError as e:
+                        failed.append(futures[future])
+
+        if self._serversByName:
             raise myESXWarning(f'Error disconnecting from hosts {[server.getName() for server in self.serverList]}')
 
-    def getESXServers(self) -> MutableSequence[myESXSERVER]:
+    @property
+    def serverList(self) -> List[myESXSERVER]:
+        """The list of ESX servers currently connected, in connection order. This is a snapshot: modifying it has no effect."""
+        return list(self._serversByName.values())
+
+    def getESXServers(self) -> List[myESXSERVER]:
         """Return the list of ESX servers currenly connected.
         
         :return: Returns a list of myESXSERVER objects.
@@ -164,11 +235,38 @@ class myESXCENTER:
         :param nodename: The hostname of the server as it was used during open.
         :return: A myESXSERVER object describing the server or None if not found.
         """
-        for server in self.serverList:
-            if server.getName() == nodename:
-                return server
-        return None
+        return self._serversByName.get(nodename)
     
+    def _forAllServers(self, query:Callable[[myESXSERVER],List[myESXVM]]) -> List[Tuple[myESXSERVER, List[myESXVM]]]:
+        """
+        Run a query on every connected server concurrently, as each one is a round trip to a different host.
+
+        :param query: A function receiving a server and returning its list of VMs.
+        :return: A list of tuples of (server, result of the query), in the order of serverList.
+        :raises Exception: The first exception raised by a query, in the order of serverList.
+        """
+        servers = self.serverList
+        if not servers:
+            return []
+        with ThreadPoolExecutor(max_workers=min(32, len(servers))) as ex:
+            return list(zip(servers, ex.map(query, servers)))
+
+    def _iterAllServers(self, query:Callable[[myESXSERVER],List[myESXVM]]) -> Iterator[Tuple[myESXSERVER, List[myESXVM]]]:
+        """
+        Run a query on every connected server concurrently, yielding each result as soon as its server answers.
+
+        :param query: A function receiving a server and returning its list of VMs.
+        :return: An iterator of tuples of (server, result of the query), in completion order.
+        :raises Exception: The exception raised by a query, when its result is reached.
+        """
+        servers = self.serverList
+        if not servers:
+            return
+        with ThreadPoolExecutor(max_workers=min(32, len(servers))) as ex:
+            futures = {ex.submit(query, server): server for server in servers}
+            for future in as_completed(futures):
+                yield (futures[future], future.result())
+
     def getVMsbyLambda(self, condition:Callable[[myESXVM],str]) -> List[Tuple[myESXSERVER, List[myESXVM]]]:
         """
         Returns a filtered subset of the list of VMs in all ESX servers. Machines are selected when the lambda
@@ -181,7 +279,7 @@ class myESXCENTER:
         :raises Exception: Raised when an error was catched while filtering the list.
         """
         try:
-            return [ (server, server.VMgetByLambda(condition)) for server in self.serverList ]
+            return self._forAllServers(lambda server: server.VMgetByLambda(condition))
         except Exception as e:
             raise myESXError(f'Error filtering the list of VMs: {str(e)}')
 
@@ -196,9 +294,26 @@ class myESXCENTER:
         :return: A list of tuples of `(server, list of VMs matching the pattern)`.
 
         """
-        # Iterate on all servers and build a tuple for each server
+        # Query all servers and build a tuple for each server
+        try:
+            # Compile once for all the servers. Literal patterns stay strings, so the servers match them as prefixes
+            compiled = _compilePattern(pattern)
+            return self._forAllServers(lambda server: server.VMgetByName(compiled))
+        except Exception as e:
+            raise myESXError(f'Error filtering the list of VMs the list of VMs for pattern {pattern}: {str(e)}')
+
+    def iterVMsbyName(self, pattern:str) -> Iterator[Tuple[myESXSERVER, List[myESXVM]]]:
+        """
+        Same as getVMsbyName(), but yields the result of each server as soon as it answers,
+        so the caller can process it while the slower servers are still being queried.
+
+        :param pattern: This is a string containing a regexp that matches VM names.
+
+        :return: An iterator of tuples of `(server, list of VMs matching the pattern)`, in completion order.
+        """
         try:
-            return [ (server, server.VMgetByName(pattern)) for server in self.serverList ]
+            compiled = _compilePattern(pattern)
+            yield from self._iterAllServers(lambda server: server.VMgetByName(compiled))
         except Exception as e:
             raise myESXError(f'Error filtering the list of VMs the list of VMs for pattern {pattern}: {str(e)}')
 
@@ -348,7 +348,7 @@ class myESXCONFIG:
             if value == []:
                 #print(f"{item} === {value}")
                 #setattr(hw,item,value)
-                mylogger.debug(f'Attribute {item}=[] not copied to ConfigSpec()')
+                mylogger.debug('Attribute %s=[] not copied to ConfigSpec()', item)
                 continue
 
             # Copy attributes with simple data types or known complex attributes and same name
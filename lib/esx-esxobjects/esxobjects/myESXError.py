@@ -10,7 +10,7 @@ class myESXError(Exception):
         self.message = message
         super().__init__(self.message)
         if log:
-            mylogger.error(message)
+            mylogger.error('%s', message)
 
 class myESXWarning(Exception):
     """Custom exception with a message."""
@@ -18,4 +18,4 @@ class myESXWarning(Exception):
         self.message = message
         super().__init__(self.message)
         if log:
-            mylogger.warning(message)
+            mylogger.warning('%s', message)
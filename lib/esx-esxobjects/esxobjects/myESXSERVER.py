@@ -6,7 +6,7 @@ Virtual Machines, Datastores, Pools, etc.
 """
 
 from optparse import Option
-from typing import Any, Callable, Optional, List, Tuple
+from typing import Any, Callable, Dict, Iterator, Optional, List, Tuple, Union
 
 # Initialize logger
 import logging
@@ -19,46 +19,180 @@ from .myESXTASK import myESXTASK
 from .myESXCONFIG import myESXCONFIG, myESXPath
 
 import pyVim.connect
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import os
+import posixpath
 import ssl
+import threading
 import time
 import re
 
 
+# Characters with a special meaning in regular expressions
+_REGEX_SPECIAL = re.compile(r'[.^$*+?{}\[\]\\|()]')
+# ESX paths: "[datastore] path/to/file" and "/vmfs/volumes/datastore/path/to/file". Trailing spaces are not part of the path
+_DS_BRACKET_RE = re.compile(r'^\[([^]]+)\] *(.*?)\s*$')
+_VMFS_VOLUMES_RE = re.compile(r'^\s*/vmfs/volumes/([^/]+)/(.*?)\s*$')
+# Random salt of the password digests in the keys of the connection pool, so they can't be looked up in precomputed tables
+_POOL_SALT = os.urandom(16)
+
+def _compilePattern(pattern:Union[str, re.Pattern]) -> Union[str, re.Pattern]:
+    """Compile a VM name pattern, unless it is a literal string.
+
+    :return: The pattern itself if it is a string without regex special characters, to be matched
+        as a prefix, or the compiled regular expression.
+    """
+    if isinstance(pattern, str) and not _REGEX_SPECIAL.search(pattern):
+        return pattern
+    return re.compile(pattern)  # returns the same object if already compiled
+
+def _envSeconds(name:str, default:float) -> float:
+    """Read a number of seconds from an environment variable.
+
+    :return: The value of the variable, or default if it is not set, not a number or negative.
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = -1
+    if not seconds >= 0:
+        mylogger.warning('Invalid value %r of %s, it must be a number of seconds >= 0. Using %s.', value, name, default)
+        return default
+    return seconds
+
+class _mySharedConnection:
+    """A connected ServiceInstance shared by all the myESXSERVER handles with the same host, user, certfile and password.
+
+    It counts the handles using it, and owns the only keepalive thread of the connection. The thread pings
+    at the interval of the first handle asking for a keepalive.
+    """
+    def __init__(self, si:vim.ServiceInstance, hostname:str):
+        self.si = si
+        self.hostname = hostname
+        self.refs = 1
+        self.keepalive_interval = 0
+        # Set by close() to wake up and stop the keepalive thread
+        self._stop_event = threading.Event()
+        self._threadLock = threading.Lock()
+        self.keepalive_thread:Optional[threading.Thread] = None
+
+    def startKeepalive(self, keepalive:int):
+        """Start the keepalive thread pinging every keepalive seconds, unless keepalive is 0 or it is already running."""
+        with self._threadLock:
+            if self.keepalive_thread is None and keepalive > 0 and not self._stop_event.is_set():
+                self.keepalive_interval = keepalive
+                self.keepalive_thread = threading.Thread(target=self._keepalive, daemon=True)
+                self.keepalive_thread.start()
+                mylogger.debug('Keepalive thread started for server %s every %d seconds.', self.hostname, self.keepalive_interval)
+
+    def _keepalive(self):
+        """Keep the connection alive by sending a ping every interval seconds."""
+        try:
+            content = self.si.RetrieveContent()
+            # Run while the connection is not terminated
+            while not self._stop_event.is_set():
+                # Reading the current session is the cheapest call that refreshes it
+                content.sessionManager.currentSession
+                mylogger.debug('Pinged server %s to keep connection alive.', self.hostname)
+                # Sleep until the next ping, waking up at once if close() sets the event
+                if self._stop_event.wait(self.keepalive_interval):
+                    return
+        except Exception as e:
+            raise myESXError(f'Error keeping connection alive to server {self.hostname}', True) from e
+
+    def close(self):
+        """Stop the keepalive thread and disconnect from the server."""
+        # Stop the keepalive thread if it exists
+        with self._threadLock:
+            self._stop_event.set()
+        if self.keepalive_thread is not None:
+            self.keepalive_thread.join()
+            self.keepalive_thread = None
+            mylogger.debug('Keepalive thread stopped for server %s.', self.hostname)
+        # Disconnect from the vSphere server
+        pyVim.connect.Disconnect(self.si)
+
 # This object manages ESX server
 class myESXSERVER:
-    """Class to handle basic operations on the API like connection, disconnection and getting resource lists."""
+    """
+    Class to handle basic operations on the API like connection, disconnection and getting resource lists.
+
+    Use it as a context manager to disconnect deterministically, even if an exception is raised::
+
+        with myESXSERVER(hostname, user, certfile, password) as server:
+            server.VMgetByName(...)
+    """
 
     RES_VM = [vim.VirtualMachine]
     """This symbol is used to get a list of VMs with getresources()"""
     RES_NET = [vim.Network]
     """This symbol is used to get a list of Networks with getresources()"""
     DEFAULT_KEEPALIVE_INTERVAL = 300
-    """This is the number of seconds between pings to keep the connection alive."""
+    """This is the number of seconds between pings to keep the connection alive, for long-lived handles such as the ones of myESXCENTER."""
+    NAME_CACHE_TTL = _envSeconds("MYESX_CACHE_TTL", 60)
+    """This is the number of seconds the name indexes of pools, networks and datastores are reused.
+    It is read from the environment variable MYESX_CACHE_TTL, 60 by default or if the value is not valid. 0 disables the indexes."""
+    VM_LIST_MAX_AGE = _envSeconds("MYESX_VM_LIST_MAX_AGE", 2)
+    """This is the default number of seconds VMgetByName and VMfirstByName reuse the list of VM names before reading it again.
+    It is read from the environment variable MYESX_VM_LIST_MAX_AGE, 2 by default or if the value is not valid. 0 always reads it."""
+    MIGRATE_RETRY_DELAY = 0.05
+    """This is the number of seconds VMMigrateHere waits before retrying a failed registration. It doubles on each retry."""
+    MIGRATE_RETRY_MAX_DELAY = 1
+    """VMMigrateHere gives up registering when the retry delay grows over this number of seconds."""
+    MIGRATE_RETRY_FAULTS = (vim.fault.InvalidState, vim.fault.TaskInProgress, vim.fault.FileLocked)
+    """Faults of a registration that VMMigrateHere retries, as the source host may still hold the VM for a moment. Other faults fail at once."""
+    _sslContexts:Dict[str, ssl.SSLContext] = {}
+    """SSL contexts by CA certificate file, shared by all the connections."""
+    _sslContextsLock = threading.Lock()
+    _pool:Dict[Tuple[str, str, str, str], _mySharedConnection] = {}
+    """Live connections by (hostname, user, certfile, password digest), shared by all the handles to the same server."""
+    _poolLock = threading.RLock()
         
-    def __init__(self, hostname:str, username:str, certfile:str, password:str = '', keepalive:int = DEFAULT_KEEPALIVE_INTERVAL):
+    def __init__(self, hostname:str, username:str, certfile:str, password:str = '', keepalive:int = 0):
         """
         Initializes the handler for the connection and connects the given host with user and password.
         If the password is provided, the initialization function includes connecting to the server and reading some API objects from
-        the server.
+        the server. If another handle is already connected to the same host with the same user, certfile and password,
+        its connection is reused instead of logging in again.
         
         :param host: This is the ip or dns name of the ESX server.
         :param user: A username with valid permissions to operate on the server.
         :param certfile: This is the full pathname of a PEM file containing the public certificate of the CA
             signing the server certificate. If certfile is "NONE" (string) then verification is disabled.
         :param password: The password of the user is never stored in the object after connection.
-        :param keepalive: The time in seconds between pings to keep the connection alive. Default is 300 seconds. If keepalive is 0, the keepalive thread is not launched.
+        :param keepalive: The time in seconds between pings to keep the connection alive. If keepalive is 0 (the default), the keepalive
+            thread is not launched: short-lived handles, like the ones used in a with block, don't need it. Handles which may stay
+            idle longer than the session timeout of the server should pass DEFAULT_KEEPALIVE_INTERVAL.
+            A shared connection has a single thread, pinging at the interval of the first handle asking for a keepalive.
         """
         # Store connection parameters
         self.hostname = hostname
         self.user = username
         self.certfile = certfile
         self.keepalive_interval:int = keepalive
-        self.keepalive_terminate:bool = False
         
         self.si:Optional[vim.ServiceInstance] = None
-        self.vms:List[myESXVM] = []
+        self._shared:Optional[_mySharedConnection] = None
+        # Key of the connection in the pool, set by _connect
+        self._poolKey:Optional[Tuple[str, str, str, str]] = None
+        # (VM, name) of all the VMs, as read by _VMgetAll. The myESXVM wrappers in vms are built from it on demand
+        self._vmRefs:List[Tuple[vim.VirtualMachine, str]] = []
+        self._vms:Optional[List[myESXVM]] = []
+        # time.monotonic() of the last refresh of vms, 0 forces the next one (see _VMgetAll)
+        self._vmsRefreshed:float = 0
+        # Name indexes by resource type, with the time they were built (see _getByName)
+        self._nameCaches:Dict[Any, Tuple[float, Dict[str, Any]]] = {}
+        # Path of the .vmx file by (datastore, directory) of the VMs registered (see _resolveVmx)
+        self._vmxPaths:Dict[Tuple[str, str], str] = {}
+        # Container views by (container, resource types), destroyed on disconnect (see _containerView)
+        self._views:Dict[Tuple[Any, Tuple[Any, ...]], vim.view.ContainerView] = {}
 
         if password:
             # Open connection (do not store password) and get server content
@@ -66,101 +200,144 @@ class myESXSERVER:
         else:
             raise myESXError('No password for connection.')            
 
-    def _keepalive(self):
-        """Keep the connection alive by sending a ping every interval seconds.
-        
-        The time in seconds between pings is set during the initialization of the object.
+    def __enter__(self) -> "myESXSERVER":
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the connection when leaving the with block. Only the last handle to a shared connection closes it."""
+        self.disconnect()
+
+    @classmethod
+    def _sslContext(cls, certfile:str) -> ssl.SSLContext:
+        """Return the SSL context validating servers with the CA in certfile ("NONE" disables verification).
+
+        Contexts are built once per certfile and shared by all the connections, to avoid
+        parsing the PEM file and setting up OpenSSL again on every connection.
         """
-        if self.si == None:
-            raise myESXError(f'No connection to server {self.hostname} to keep alive.', True)
-        try:
-            # Run while the connection is not terminated
-            while not self.keepalive_terminate:
-                self.si.RetrieveContent()  # This will ping the server
-                mylogger.debug(f'Pinged server {self.hostname} to keep connection alive.')
-                count:int = 0
-                while count < self.keepalive_interval and not self.keepalive_terminate:
-                    count += 1
-                    time.sleep(1)
-        except Exception as e:
-            raise myESXError(f'Error keeping connection alive to server {self.hostname}', True) from e
-        
+        with cls._sslContextsLock:
+            context = cls._sslContexts.get(certfile)
+            if context is None:
+                context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                if certfile != "NONE":
+                    context.load_verify_locations(certfile)
+                    context.check_hostname = True
+                    context.verify_mode = ssl.CERT_REQUIRED
+                else:
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                cls._sslContexts[certfile] = context
+            return context
 
     def _connect(self, password:str):
-        """Open the connection to this ESX host. In case of error, an exception is raised.
+        """Open the connection to this ESX host, or reuse the one of another handle to it. In case of error, an exception is raised.
         
         :param password: The password of the user. The password is never stored in this object after being used.
         :raises myESXError: Raised if an exception is received while connecting the server.
         """
-        if self.certfile != "NONE":
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            context.load_verify_locations(self.certfile)
-            context.check_hostname = True
-            context.verify_mode = ssl.CERT_REQUIRED
-        else:
-            context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-
+        # The password is part of the key, so a handle with other credentials never gets a logged in connection.
+        # Only a salted digest of it is kept
+        digest = hashlib.sha256(_POOL_SALT + password.encode()).hexdigest()
+        key = self._poolKey = (self.hostname, self.user, self.certfile, digest)
         try:
-            # Connect to the vSphere server
-            self.si = pyVim.connect.SmartConnect(
-                host=self.hostname,
-                user=self.user,
-                pwd=password,
-                sslContext=context
-            )
-            mylogger.debug(f'Connection to host {self.hostname} as {self.user} succeeded.')
+            self._shared = self._acquire(key)
+            if self._shared is None:
+                context = self._sslContext(self.certfile)
+                # Connect to the vSphere server. The pool is not locked meanwhile, so other servers can connect in parallel
+                si = pyVim.connect.SmartConnect(
+                    host=self.hostname,
+                    user=self.user,
+                    pwd=password,
+                    sslContext=context
+                )
+                mylogger.debug('Connection to host %s as %s succeeded.', self.hostname, self.user)
+                with self._poolLock:
+                    # Another handle may have connected meanwhile: keep its connection and drop this one
+                    self._shared = self._acquire(key)
+                    if self._shared is None:
+                        self._shared = self._pool[key] = _mySharedConnection(si, self.hostname)
+                if self._shared.si is not si:
+                    pyVim.connect.Disconnect(si)
+            # Start the keepalive thread if keepalive is not 0, also on a connection opened by a handle without keepalive
+            self._shared.startKeepalive(self.keepalive_interval)
+            self.si = self._shared.si
             # Create shortcuts for important objects
             self.content:vim.ServiceInstanceContent = self.si.RetrieveContent()
             # Retrieve the datacenter from the connection
             self.datacenter:vim.Datacenter = self.content.rootFolder.childEntity[0] # type: ignore
             # Retrieve the host from the datacenter
-            self.host:vim.ComputeResource = self.datacenter.hostFolder.childEntity[0] # type: ignore
+            self.hostFolder:vim.Folder = self.datacenter.hostFolder # type: ignore
+            self.host:vim.ComputeResource = self.hostFolder.childEntity[0] # type: ignore
 
             # Retrieve the fileManager from the connection
             self.fileManager:vim.FileManager = self.content.fileManager # type: ignore
             # Retrieve the virtualDiskManager from the connection
             self.virtualDiskManager:vim.VirtualDiskManager = self.content.virtualDiskManager # type: ignore
 
-            # Start the keepalive thread if keepalive is not 0
-            if self.keepalive_interval > 0:
-                import threading
-                self.keepalive_thread = threading.Thread(target=self._keepalive, daemon=True)
-                self.keepalive_thread.start()
-                mylogger.debug(f'Keepalive thread started for server {self.hostname} every {self.keepalive_interval} seconds.')
-
         except Exception as e:
+            if self._shared is not None:
+                self.si = None
+                self._shared = None
+                self._release(key)
             raise myESXError(f'Error connecting to server {self.hostname} as user {self.user}', True) from e
 
+    @classmethod
+    def _acquire(cls, key:Tuple[str, str, str, str]) -> Optional[_mySharedConnection]:
+        """Take a reference to a shared connection, if there is one.
+
+        :return: The connection, or None if there is no connection to share.
+        """
+        with cls._poolLock:
+            shared = cls._pool.get(key)
+            if shared is None:
+                return None
+            shared.refs += 1
+            mylogger.debug('Reusing connection to host %s as %s.', key[0], key[1])
+            return shared
+
+    @classmethod
+    def _release(cls, key:Tuple[str, str, str, str]):
+        """Drop a reference to a shared connection, and close it when no handle uses it anymore."""
+        with cls._poolLock:
+            shared = cls._pool[key]
+            shared.refs -= 1
+            if shared.refs > 0:
+                return
+            del cls._pool[key]
+        shared.close()
+
     def disconnect(self):
         """
-        Closes connection to ESX host.
+        Closes connection to ESX host. The connection is shared with other handles to the same server,
+        and it is only closed by the last one. Disconnecting an already closed handle does nothing.
 
         :raises myESXError: Raised if an exception was received while disconnecting the server. 
         """
-        if self.si == None:                
-            raise myESXWarning(f'Closing already closed connection to {self.hostname}', True)
+        if self.si == None:
+            mylogger.debug('Connection to %s already closed.', self.hostname)
+            return
         try:
-            # Stop the keepalive thread if it exists
-            if self.keepalive_thread is not None:
-                self.keepalive_terminate = True
-                self.keepalive_thread.join()
-                self.keepalive_thread = None
-            mylogger.debug(f'Keepalive thread stopped for server {self.hostname}.')
-
+            # Destroy the container views of this handle: they would live at the server as long as the session
+            for view in self._views.values():
+                try:
+                    view.Destroy()
+                except Exception as e:
+                    mylogger.debug('Error destroying a container view of server %s: %s', self.hostname, e)
+            self._views.clear()
             # Remove shortcuts for some important objects
-            del self.virtualDiskManager
-            del self.fileManager
-            del self.host
-            del self.datacenter
-            del self.content
-            # Disconnect from the vSphere server
-            pyVim.connect.Disconnect(self.si)
+            for attr in ('vmFolder', 'virtualDiskManager', 'fileManager', 'host', 'hostFolder', 'datacenter', 'content'):
+                self.__dict__.pop(attr, None)
             self.si = None
+            self._shared = None
+            # Disconnect from the vSphere server if this was the last handle
+            self._release(self._poolKey)
         except Exception as e:
             raise myESXError(f'Error disconnecting from server {self.hostname}', True) from e
 
+    @functools.cached_property
+    def vmFolder(self) -> vim.Folder:
+        """The folder of the VMs of the datacenter. Read from the server the first time it is used, as reading it is a round trip."""
+        return self.datacenter.vmFolder
+
     def getName(self) -> str:
         """
         Return the hostname of this server.
@@ -187,13 +364,14 @@ class myESXSERVER:
         except Exception as e:
             raise myESXError(f'Error filtering the list of VMs the list of VMs from server {self.hostname}', True) from e
 
-    def VMgetByanyfield(self, pattern:str, getfield:Callable[[myESXVM],str]) -> List[myESXVM]:
+    def VMgetByanyfield(self, pattern:Union[str, re.Pattern], getfield:Callable[[myESXVM],str]) -> List[myESXVM]:
         """
         Return a filtered subset of the list of VMs.
         
         :param pattern: This is a string containing a regexp that the machines in the list match.
             The regular expression must match the whole string. For example, ".*SERVER.*"
             will match NFS_SERVER_001, but "SERVER" will not match it.
+            An already compiled pattern is also accepted, and used as is.
             
         :param getfield: This parameter is a function which returns one string from the VM to match.
             This function is applied to each VM to generate a string to match with the pattern.
@@ -206,26 +384,96 @@ class myESXSERVER:
         :raises myESXError: Raised if an exception was received while filtering the VMs. 
         """
         try:
-            return [ v for v in self.vms if re.match(pattern, getfield(v)) ]
+            return list(self._VMiterByanyfield(pattern, getfield))
         except Exception as e:
             raise myESXError(f'Error filtering the list of VMs the list of VMs from server {self.hostname}', True) from e
 
-    def VMgetByName(self, pattern:str) -> List[myESXVM]:
+    def _VMiterByanyfield(self, pattern:Union[str, re.Pattern], getfield:Callable[[myESXVM],str]) -> Iterator[myESXVM]:
+        """Generator of the VMs whose field matches the pattern. See VMgetByanyfield."""
+        matches = self._matcher(pattern)
+        return ( v for v in self.vms if matches(getfield(v)) )
+
+    def _VMiterByName(self, pattern:Union[str, re.Pattern]) -> Iterator[myESXVM]:
+        """Generator of the VMs whose name matches the pattern. See VMgetByName.
+
+        Names are matched on the names read by _VMgetAll, and only the matching VMs are wrapped
+        in myESXVM objects, unless the whole list in vms was already built."""
+        matches = self._matcher(pattern)
+        if self._vms is not None:
+            return ( v for v in self._vms if matches(v.getName()) )
+        return ( myESXVM(v, name=name) for v, name in self._vmRefs if matches(name) )
+
+    @staticmethod
+    def _matcher(pattern:Union[str, re.Pattern]) -> Callable[[str], Any]:
+        """Return a function telling if a string matches the pattern from its start, as re.match does."""
+        compiled = _compilePattern(pattern)
+        if isinstance(compiled, str):
+            # A literal pattern only matches strings starting with it: no regex needed
+            return lambda field: field.startswith(compiled)
+        return compiled.match
+
+    @property
+    def vms(self) -> List[myESXVM]:
+        """The list of VMs read by the last refresh (see VMgetByName)."""
+        if self._vms is None:
+            self._vms = [myESXVM(v, name=name) for v, name in self._vmRefs]
+        return self._vms
+
+    def VMgetByName(self, pattern:Union[str, re.Pattern], maxAge:Optional[float] = None) -> List[myESXVM]:
         """
         Returns a filtered subset of the list of VMs whose name matches the pattern.
         
         :param pattern: This is a string containing a regexp that matches VM names.
             The regular expression must match the whole string. For example, ".*SERVER.*"
             will match NFS_SERVER_001, but "SERVER" will not match it.
+            An already compiled pattern is also accepted.
+        :param maxAge: The list of VMs is refreshed from the server unless it was refreshed less than maxAge
+            seconds ago. VM_LIST_MAX_AGE by default, so lookups in a row share one query. VMs registered or created
+            through this object show up at once; pass 0 to also see the changes made by other clients at once.
         :return: A list of VMs matching the pattern.
         :raises myESXError: Raised if an exception was received while filtering the VMs. 
         """
+        if maxAge is None:
+            maxAge = self.VM_LIST_MAX_AGE
         try:
-            self._VMgetAll()
-            return self.VMgetByanyfield(pattern, myESXVM.getName)
+            self._VMgetAll(maxAge)
+            return list(self._VMiterByName(pattern))
         except Exception as e:
             raise myESXError(f'Error filtering the list of VMs the list of VMs from server {self.hostname}', True) from e
 
+    def VMfirstByLambda(self, condition:Callable[[myESXVM],str]) -> Optional[myESXVM]:
+        """
+        Return the first VM for which the lambda function evaluates to True. Unlike VMgetByLambda,
+        the rest of the VMs are not evaluated once one is found.
+
+        :param function: This is a function which returns True if the machine should be selected.
+        :return: Returns the first VM matching the condition, or None if no VM matches it.
+        :raises myESXError: Raised when an exception was received while filtering the list of VMs.
+        """
+        try:
+            return next(( v for v in self.vms if condition(v) ), None)
+        except Exception as e:
+            raise myESXError(f'Error filtering the list of VMs from server {self.hostname}', True) from e
+
+    def VMfirstByName(self, pattern:Union[str, re.Pattern], maxAge:Optional[float] = None) -> Optional[myESXVM]:
+        """
+        Returns the first VM whose name matches the pattern. Unlike VMgetByName, the rest of the
+        VMs are not matched once one is found.
+
+        :param pattern: A regexp that matches VM names, as in VMgetByName.
+        :param maxAge: The list of VMs is refreshed from the server unless it was refreshed less than maxAge
+            seconds ago, as in VMgetByName.
+        :return: The first VM matching the pattern, or None if no VM matches it.
+        :raises myESXError: Raised if an exception was received while filtering the VMs.
+        """
+        if maxAge is None:
+            maxAge = self.VM_LIST_MAX_AGE
+        try:
+            self._VMgetAll(maxAge)
+            return next(self._VMiterByName(pattern), None)
+        except Exception as e:
+            raise myESXError(f'Error filtering the list of VMs from server {self.hostname}', True) from e
+
     def VMMigrateHere(self, vm:myESXVM, dstPool:Optional[vim.ResourcePool] = None) -> bool:
         """
         Migrate to this host an existing virtual machine from another ESX host. The VM must already be in powered off state. The VM files must be in a data store shared by the source and destination ESX.
@@ -245,8 +493,8 @@ class myESXSERVER:
 
         # Get VM name
         name:str = vm.getName()
-        # Get VM directory
-        vmx_dir:str = vm._get_vmx_path()
+        # Get VM directory and vmx file, so registering doesn't need to search for it
+        vmx_dir, vmx_file = vm._get_vmx_location()
 
         # Destination pool from source machine if not specified as argument
         if not dstPool:
@@ -257,26 +505,41 @@ class myESXSERVER:
 
         # Unregister from machine's host
         try:
-            mylogger.debug(f'Unregistering VM {vm.getName()} from host {vm.getHost().name}')
+            # The arguments are API calls: only make them if the message will be logged
+            if mylogger.isEnabledFor(logging.DEBUG):
+                mylogger.debug('Unregistering VM %s from host %s', vm.getName(), vm.getHost().name)
             vm.unregister()
         except Exception as e:
             raise myESXError(f'VM ({vm.getName()}) failed to unregister from source host.', True)
 
-        # Register in current host after 1 second
-        time.sleep(1)
-        mylogger.debug(f'Registering VM <{vmx_dir}, {name}, {dstPool}> on server {self.hostname}')
-        try:
-            return self.VMRegister(name=name, vmPath=vmx_dir, pool=dstPool)
-        except Exception as e:
-            raise myESXError(f'VM ({vm.getName()}) failed to register at host {self.getName()}.', True)
-
-    def VMRegister(self, name:str, vmPath:str, pool:vim.ResourcePool) ->bool:
+        # Register in current host. The source host may hold the files for a moment after unregistering:
+        # instead of always sleeping, retry with a growing delay only if registering fails with a transient fault
+        mylogger.debug('Registering VM <%s, %s, %s> on server %s', vmx_dir, name, dstPool, self.hostname)
+        delay = self.MIGRATE_RETRY_DELAY
+        while True:
+            try:
+                task = self._VMRegisterTask(name, vmx_dir, dstPool, vmx_file)
+                task.wait()
+                if task.isOK():
+                    return True
+                # The fault the task failed with, as it would have been raised by the call
+                fault:Exception = task._info().error
+            except Exception as e:
+                fault = e
+            if not isinstance(fault, self.MIGRATE_RETRY_FAULTS) or delay > self.MIGRATE_RETRY_MAX_DELAY:
+                raise myESXError(f'VM ({name}) failed to register at host {self.getName()}: {getattr(fault, "msg", None) or fault}', True) from fault
+            mylogger.debug('Registering VM %s failed (%s), retrying in %s seconds.', name, type(fault).__name__, delay)
+            time.sleep(delay)
+            delay *= 2
+
+    def VMRegister(self, name:str, vmPath:str, pool:vim.ResourcePool, vmxFile:Optional[str] = None) ->bool:
         """
         Register an existing virtual machine directory indicating the path to the directory containing the virtual machine, its name, and the pool to register in. The directory path can be in one of the following formats:
                   - /vmfs/volumes/datastore/path/to/VM/directory
                   - [datastore] path/to/VM/directory
 
-        A *.vmx file must exist inside the VM directory.
+        A *.vmx file must exist inside the VM directory. Unless its name is given, the directory is searched for it;
+        the file found is remembered for later registrations of the same directory.
 
         :param name: Label of the virtual machine.
         :type name: str
@@ -284,23 +547,57 @@ class myESXSERVER:
         :type vmPath: str
         :param pool: Pool to register the VM in. Must be obtained calling PoolbyName.  If no pool is provided, the VM will be registered at the top resource pool of the server.
         :type pool: vim.ResourcePool
+        :param vmxFile: The filename of the .vmx file inside vmPath, if it is already known.
         :return: True if success.
         :rtype: bool
         :raises myESXError: Raised if the .vmx file could not be found, or the VM could not be registered.
         """
 
+        # Register the VM and wait for the task to end
+        task = self._VMRegisterTask(name, vmPath, pool, vmxFile)
+        task.wait()
+        if task.isOK():
+            return True
+        else:
+            raise myESXError(f"Failed to register VM: {task.getError()} on host {self.hostname}")
+
+    def VMRegisterMany(self, vms:List[Tuple[str, str, Optional[vim.ResourcePool]]], timeout:float = None) -> List[bool]:
+        """
+        Register several existing virtual machine directories, like VMRegister, starting all the tasks
+        first and then waiting for all of them together with waitAll().
+
+        :param vms: A list of tuples (name, vmPath, pool), with the same meaning as the parameters of VMRegister.
+        :param timeout: Maximum time to wait for all the tasks to complete, in seconds.
+        :return: A list with True for each VM registered successfully, in the same order as vms.
+        :raises myESXError: Raised if a .vmx file could not be found.
+        """
+        tasks = [self._VMRegisterTask(name, vmPath, pool) for name, vmPath, pool in vms]
+        results = self.waitAll(tasks, timeout)
+        for (name, vmPath, pool), task, ok in zip(vms, tasks, results):
+            if not ok:
+                mylogger.error("Failed to register VM %s: %s on host %s", name, task.getError(), self.hostname)
+        return results
+
+    def _VMRegisterTask(self, name:str, vmPath:str, pool:Optional[vim.ResourcePool], vmxFile:Optional[str] = None) -> myESXTASK:
+        """
+        Start the registration of a VM directory. See VMRegister.
+
+        :return: The task which registers the VM.
+        :raises myESXError: Raised if the .vmx file could not be found.
+        """
         if pool == None:
             pool = self.PoolgetByName()
 
         # Find the vmx file
-        vmx_paths = self._findFiles(vmPath, '*.vmx')
-        if len(vmx_paths) != 1:
-            raise myESXError(f'Error looking for VMX file at directory {vmPath}')
+        if vmxFile:
+            dsname, pathname = self._splitPath(vmPath)
+            vmx_path = f"[{dsname}] {pathname}/{vmxFile}"
         else:
-            vmx_path = vmx_paths.pop()
+            vmx_path = self._resolveVmx(vmPath)
         # Register the VM
-        task = myESXTASK(
-            self.datacenter.vmFolder.RegisterVm(
+        self._vmsRefreshed = 0
+        return myESXTASK(
+            self.vmFolder.RegisterVm(
                 path=vmx_path,  # Path to the .vmx file
                 name=name,  # Name of the VM (can be different from the .vmx file)
                 asTemplate=False,  # Set to True if registering as a template
@@ -309,13 +606,6 @@ class myESXSERVER:
             )
         )
 
-        # Wait for the task to end
-        task.wait()
-        if task.isOK():
-            return True
-        else:
-            raise myESXError(f"Failed to register VM: {task.getError()} on host {self.hostname}")
-
     def VMCreate(self, vmconfig:myESXCONFIG, vmPath:str, name:str, pool:Optional[vim.ResourcePool] = None) -> myESXTASK:
         """
         Create a new virtual machine directory indicating the path to the new directory containing the virtual machine, its name, and the pool to register in. The directory path can be in one of the following formats:
@@ -340,14 +630,31 @@ class myESXSERVER:
         vmconfig.setDir(vmPath)
 
         # Create the VM
+        self._vmsRefreshed = 0
         return myESXTASK(
-            self.datacenter.vmFolder.CreateVm(
+            self.vmFolder.CreateVm(
                 config=vmconfig.getConfigSpec(), # ConfigSpec of the new machine
                 pool=pool, # Resource pool
                 host=None
             )
         )
 
+    #######################################################################
+    # Tasks
+    #######################################################################
+
+    def waitAll(self, tasks:List[myESXTASK], timeout:float = None) -> List[bool]:
+        """
+        Wait for several tasks of this server to end. Instead of polling each task, a PropertyCollector filter over all
+        of them is created, and each WaitForUpdatesEx call returns the state changes of the whole batch (see myESXTASK.waitAll).
+
+        :param tasks: The tasks to wait for.
+        :param timeout: Maximum time to wait for all the tasks to complete, in seconds.
+        :return: A list with True for each task ended with success, in the same order as tasks.
+        :raises myESXWarning: Raised if some task didn't end before the timeout expired.
+        """
+        return myESXTASK.waitAll(tasks, timeout)
+
     #######################################################################
     # Files and directories
     #######################################################################
@@ -358,9 +665,9 @@ class myESXSERVER:
         :param path: The path of the directory including the data store between brackets.
         :return: True if directory exists and false otherwise.
         """
-        # Check if directory exists
+        # Check if directory exists: list only its parent directory, not the whole subtree below it
         esxpath = myESXPath(path)
-        res = self._findFiles(esxpath.dirname(), esxpath.basename() )
+        res = self._findFiles(esxpath.dirname(), esxpath.basename(), recurse=False)
         return res != []
     
     def FSmkDir(self, path: str):
@@ -564,11 +871,28 @@ class myESXSERVER:
         """
         try:
             # Retrieve a view of a list of resources
-            container = self.content.viewManager.CreateContainerView(self.content.rootFolder, resource_list, True)
+            view = self._containerView(self.content.rootFolder, resource_list)
         except Exception as e:
             raise myESXError(f'Error retrieving a list of resources from server {self.hostname}') from e
         
-        return container.view
+        return view.view
+
+    def _containerView(self, container, resource_list) -> vim.view.ContainerView:
+        """
+        Get a view of all the resources of some types inside a container, recursively.
+
+        Views live at the server until destroyed, and the server keeps them up to date: one view is
+        created per container and resource types, reused by later calls and destroyed by disconnect().
+
+        :param container: The inventory object to search.
+        :param resource_list: A list with some vmomi object types to get.
+        :return: The container view.
+        """
+        key = (container, tuple(resource_list))
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = self.content.viewManager.CreateContainerView(container, resource_list, True)
+        return view
 
     def NetgetByName(self, net_name:str) -> Optional[vim.Network]:
         """
@@ -582,11 +906,7 @@ class myESXSERVER:
         if net_name is None:
             return None
 
-        # Traverse compute resources (clusters or standalone hosts)
-        for net in self.host.network:
-            if net.name == net_name:
-                return net
-        return None
+        return self._getByName(vim.Network, lambda: self.datacenter.networkFolder, net_name)
 
     def PoolgetByName(self, resource_pool_name:str = None) -> Optional[vim.ResourcePool]:
         """
@@ -599,13 +919,8 @@ class myESXSERVER:
         if resource_pool_name is None:
             resource_pool_name = 'Resources'
 
-        # Traverse compute resources (clusters or standalone hosts)
-        for host in self.datacenter.hostFolder.childEntity:
-            # Traverse nested resource pools
-            for pool in self._PoolgetAll(host.resourcePool):
-                if pool.name == resource_pool_name:
-                    return pool
-        return None
+        # Nested resource pools of all compute resources (clusters or standalone hosts)
+        return self._getByName(vim.ResourcePool, lambda: self.hostFolder, resource_pool_name)
 
     def DSgetByName(self, datastore_name:str) -> Optional[vim.Datastore]:
         """
@@ -614,10 +929,7 @@ class myESXSERVER:
         :param datastore_name: The name of the data store to return.
         :return: The datastore object or None if not found..
         """
-        for datastore in self.datacenter.datastore:
-            if datastore.name == datastore_name:
-                return datastore
-        return None
+        return self._getByName(vim.Datastore, lambda: self.datacenter.datastoreFolder, datastore_name)
 
     def DSgetAll(self) -> List[vim.Datastore]:
         """Return the list of data stores of this server.
@@ -626,36 +938,94 @@ class myESXSERVER:
         """
         return self.datacenter.datastore
 
-    def _VMgetAll(self):
+    def refreshNames(self):
+        """Forget the name indexes of pools, networks and datastores, so the next lookups read them again
+        from the server. Use it after creating, renaming or deleting some of them."""
+        self._nameCaches.clear()
+
+    def _getByName(self, resource_type, container:Callable[[], Any], name:str) -> Any:
+        """
+        Look up a resource by name in a name index of all the resources of that type.
+
+        The index is built with one PropertyCollector query and reused for NAME_CACHE_TTL seconds,
+        so repeated lookups (e.g. migrating or registering many VMs) do not walk the inventory again.
+        When several resources have the same name, the first one found is returned.
+
+        :param resource_type: The vmomi type of the resource (e.g. vim.Datastore).
+        :param container: A function returning the inventory object containing the resources. It is only called
+            to build the index: reading the folders of the datacenter is a round trip to the server.
+        :param name: The name of the resource to find.
+        :return: The resource or None if not found.
+        """
+        now = time.monotonic()
+        cached = self._nameCaches.get(resource_type)
+        if cached is None or now - cached[0] >= self.NAME_CACHE_TTL:
+            index:Dict[str, Any] = {}
+            for obj, props in self._retrieveProperties([resource_type], ['name'], container()):
+                index.setdefault(props.get('name'), obj)
+            cached = (now, index)
+            self._nameCaches[resource_type] = cached
+        return cached[1].get(name)
+
+    def _retrieveProperties(self, resource_list, pathSet:List[str], container = None) -> List[Tuple[Any, dict]]:
+        """
+        Get some properties of all the resources of some types with a single PropertyCollector query,
+        instead of one round trip per resource and property.
+
+        :param resource_list: A list with some vmomi object types to get (e.g. RES_VM).
+        :param pathSet: The property paths to retrieve, e.g. ['name'].
+        :param container: The inventory object to search recursively. Default is the root folder.
+        :return: A list of tuples (object, {property path: value}).
+        """
+        if container is None:
+            container = self.content.rootFolder
+        view = self._containerView(container, resource_list)
+        # Start at the view and follow its 'view' property to the resources it contains
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView', path='view', skip=False, type=vim.view.ContainerView)
+        objSpec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+        propSpecs = [vmodl.query.PropertyCollector.PropertySpec(type=t, pathSet=pathSet) for t in resource_list]
+        filterSpec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[objSpec], propSet=propSpecs)
+        collector = self.content.propertyCollector
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=500)
+
+        # Results come in pages: follow the token until the last one
+        resources:List[Tuple[Any, dict]] = []
+        result = collector.RetrievePropertiesEx(specSet=[filterSpec], options=options)
+        while result is not None:
+            resources.extend((o.obj, {p.name: p.val for p in o.propSet}) for o in result.objects)
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(token=result.token)
+        return resources
+
+    def _VMgetAll(self, maxAge:float = 0):
         """Refresh the list of vms from the ESX server.
         
-        The list of VMs can be accessed in the vms field."""
+        The list of VMs can be accessed in the vms field.
+        The names of all the VMs are fetched in the same query, so filtering by name needs no more round trips.
+        The myESXVM objects are only built when needed: all of them when vms is read, only the matching ones by VMgetByName.
+
+        :param maxAge: Keep the current list if it was refreshed less than maxAge seconds ago. 0 always refreshes it."""
         if self.si == None:                
-            self.vms = []
+            self._vmRefs, self._vms = [], []
             raise myESXError(f'Error getting VMs from already closed connection to {self.hostname}')
+        if maxAge > 0 and time.monotonic() - self._vmsRefreshed < maxAge:
+            return
         try:
-            self.vms = [myESXVM(v) for v in self._getresources(self.RES_VM)]
+            self._vmRefs = [(v, props.get('name')) for v, props in self._retrieveProperties(self.RES_VM, ['name'])]
+            self._vms = None
+            self._vmsRefreshed = time.monotonic()
         except Exception as e:
             raise myESXError(f'Error refreshing the list of VMs from server {self.hostname}') from e
 
-    def _PoolgetAll(self, resource_pool:vim.ResourcePool) -> List[vim.ResourcePool]:
-        """
-        Recursively traverse nested resource pools.
-
-        Returns a list of all resource pools of this ESX server.
-        """
-        pools = [resource_pool]
-        for pool in resource_pool.resourcePool:
-            pools.extend(self._PoolgetAll(pool))
-        return pools
-
-    def _findFilesByName(self, dsname:str, directory_path:str, filter:str = "*") -> List[str]:
+    def _findFilesByName(self, dsname:str, directory_path:str, filter:str = "*", recurse:bool = True) -> List[str]:
         """
         Returns a list of all filenames inside [datastore] directory_path/<filter> matching the given filter.
 
         :param dsname: The name of the datastore.
         :param directory_path: The path inside which file search starts. 
         :param filter: That is a string that can contain wildcard expression for filenames.
+        :param recurse: Search also the subfolders of directory_path. If False, only directory_path itself is listed.
         :return: A list of strings with the names of the files found.
         """
         try:
@@ -668,10 +1038,11 @@ class myESXSERVER:
             search_spec = vim.host.DatastoreBrowser.SearchSpec()
             search_spec.matchPattern = [filter]  # List files and directories with given filter
 
-            # Search the directory
+            # Search the directory, and its subfolders if requested
+            search = browser.SearchSubFolders if recurse else browser.Search
             task = myESXTASK(
-                browser.SearchSubFolders(
-                    datastorePath=f"[{datastore.name}] {directory_path}",
+                search(
+                    datastorePath=f"[{dsname}] {directory_path}",
                     searchSpec=search_spec
                 )
             )
@@ -679,11 +1050,10 @@ class myESXSERVER:
             # Wait for the task to end
             taskInfo = task.wait()
             if task.isOK():
-                res = []
-                for result in taskInfo.result: # type: ignore
-                    for file in result.file:
-                        res.append(f"[{datastore.name}] {directory_path}/{file.path}")
-                return res
+                # SearchSubFolders returns a list of results, one per folder. Search returns one result.
+                results = taskInfo.result if recurse else [taskInfo.result]
+                prefix = f"[{dsname}] {directory_path}/"
+                return [prefix + file.path for result in results for file in result.file] # type: ignore
             else:
                 raise myESXError(f"Failed to list directory: {task.getError()} on host {self.hostname}")
                 
@@ -691,48 +1061,47 @@ class myESXSERVER:
             mylogger.exception(e)
             raise myESXError(f'Error listing directory [{dsname}]{directory_path} at server {self.hostname}') from e
 
-    def _findFiles(self, vmx_path:str, filter:str) -> List[str]:
+    def _findFiles(self, vmx_path:str, filter:str, recurse:bool = True) -> List[str]:
         """Get the name of the vmx file of a VM inside the given directory.
 
         :param vmx_path: The directory of a VM containing a .vmx file. The path can be
          either [datastore] path/to/the/directory
          or /vmfs/volumes/datastore/path/to/the/directory
         :param filter: A wildcard to filter files.
+        :param recurse: Search also the subfolders of the directory.
         
         :return: A list of valid paths to files found or an empty string."""
-        # Check if path is [datastore] path/to/VM/directory
-        span=re.match(r'^\[([^]]+)\] *(.*) *', vmx_path)
-        if span != None:
-            dsname=span.group(1)
-            pathname=span.group(2)
-        else:
-            span=re.match(r' */vmfs/volumes/([^/]+)/(.*) *', vmx_path)
-            if span != None:
-                dsname=span.group(1)
-                pathname=span.group(2)
-            else:
-                raise myESXError(f'Path does not contain a valid ESX path.')
-        filelist = self._findFilesByName(dsname, pathname, filter=filter)
+        dsname, pathname = self._splitPath(vmx_path)
+        filelist = self._findFilesByName(dsname, pathname, filter=filter, recurse=recurse)
         return filelist
 
+    def _resolveVmx(self, vmPath:str) -> str:
+        """Get the path of the only .vmx file inside a VM directory, searching the datastore only the first
+        time the directory is registered by this handle.
+
+        :param vmPath: The directory of a VM, in any of the formats accepted by _splitPath.
+        :return: The path of the .vmx file, as [datastore] path/to/file.vmx
+        :raises myESXError: Raised if there is not exactly one .vmx file in the directory.
+        """
+        key = self._splitPath(vmPath)
+        vmx_path = self._vmxPaths.get(key)
+        if vmx_path is None:
+            vmx_paths = self._findFiles(vmPath, '*.vmx')
+            if len(vmx_paths) != 1:
+                raise myESXError(f'Error looking for VMX file at directory {vmPath}')
+            vmx_path = self._vmxPaths[key] = vmx_paths.pop()
+        return vmx_path
+
     def _splitPath(self, path:str) -> Tuple[str, str]:
         """Split a pathname into datastore name and directory path.
 
         :param path: A pathname to split. The path can be either [datastore] path/to/the/directory or /vmfs/volumes/datastore/path/to/the/directory
         :return: A tuple with a DS name and a pathname."""
-        # Check if path is [datastore] path/to/VM/directory
-        span=re.match(r'^\[([^]]+)\] *(.*) *', path)
-        if span != None:
-            dsname=span.group(1)
-            pathname=span.group(2)
-        else:
-            span=re.match(r' */vmfs/volumes/([^/]+)/(.*) *', path)
-            if span != None:
-                dsname=span.group(1)
-                pathname=span.group(2)
-            else:
-                raise myESXError(f'Path does not contain a valid ESX path.')
-        return dsname, pathname
+        # Check if path is [datastore] path/to/VM/directory, else /vmfs/volumes/datastore/path/to/VM/directory
+        span = _DS_BRACKET_RE.match(path) or _VMFS_VOLUMES_RE.match(path)
+        if span == None:
+            raise myESXError(f'Path does not contain a valid ESX path.')
+        return span.group(1), span.group(2)
 
     def lsFiles(self, path:str, filter:str = "*", recurse:bool = False, type:List[vim.host.DatastoreBrowser.Query] = [], details:bool = False) -> List[Tuple[str, vim.host.DatastoreBrowser.FileInfo]]:
         """
@@ -773,7 +1142,7 @@ class myESXSERVER:
                 # Search the directory
                 task = myESXTASK(
                     browser.SearchSubFolders(
-                        datastorePath=f"[{datastore.name}] {directory_path}",
+                        datastorePath=f"[{dsname}] {directory_path}",
                         searchSpec=search_spec
                     )
                 )
@@ -781,7 +1150,7 @@ class myESXSERVER:
                 # Search the directory
                 task = myESXTASK(
                     browser.Search(
-                        datastorePath=f"[{datastore.name}] {directory_path}",
+                        datastorePath=f"[{dsname}] {directory_path}",
                         searchSpec=search_spec
                     )
                 )
@@ -795,15 +1164,74 @@ class myESXSERVER:
                 else:
                     searchResults = [taskInfo.result] # type: ignore
 
-                res = []
-                for result in searchResults: # type: ignore
-                    files:List[vim.host.DatastoreBrowser.FileInfo] = result.file
-                    for file in files:
-                        res.append((f"{result.folderPath}/{file.path}", file)) # type: ignore
-                return res
+                return [(f"{result.folderPath}/{file.path}", file) for result in searchResults for file in result.file] # type: ignore
             else:
                 raise myESXError(f"Failed to list directory: {task.getError()} on host {self.hostname}")
                 
         except Exception as e:
             mylogger.exception(e)
             raise myESXError(f'Error listing path {path} at server {self.hostname}') from e
+
+    def lsFilesBatch(self, dsname:str, directory_paths:List[str], filter:str = "*", recurse:bool = False) -> Dict[str, List[Tuple[str, vim.host.DatastoreBrowser.FileInfo]]]:
+        """
+        List several directories of a datastore with a single search task, instead of one lsFiles call
+        per directory. The common ancestor of the directories is searched recursively, and the files
+        found are distributed by directory.
+
+        :param dsname: The name of the datastore.
+        :param directory_paths: The paths of the directories inside the datastore, like path/to/the/directory.
+        :param filter: That is a string that can contain wildcard expression for filenames.
+        :param recurse: Include also the files in the subfolders of each directory.
+        :return: A dictionary with a list of (path, FileInfo) for each directory, like lsFiles returns.
+        :raises myESXError: Datastore not found or failed to list the directories.
+        """
+        if not directory_paths:
+            return {}
+        try:
+            datastore:Optional[vim.Datastore] = self.DSgetByName(dsname)
+            if not datastore:
+                raise myESXError(f'Datastore {dsname} not found.')
+            directories = {path: path.strip('/') for path in directory_paths}
+            common = posixpath.commonpath(list(directories.values()))
+
+            search_spec = vim.host.DatastoreBrowser.SearchSpec()
+            search_spec.matchPattern = [filter]  # List files and directories with given filter
+            task = myESXTASK(
+                datastore.browser.SearchSubFolders(
+                    datastorePath=f"[{dsname}] {common}",
+                    searchSpec=search_spec
+                )
+            )
+            taskInfo = task.wait()
+            if not task.isOK():
+                raise myESXError(f"Failed to list directory: {task.getError()} on host {self.hostname}")
+
+            res:Dict[str, List[Tuple[str, vim.host.DatastoreBrowser.FileInfo]]] = {path: [] for path in directory_paths}
+            for result in taskInfo.result: # type: ignore
+                # folderPath is [datastore] path/to/the/folder, maybe with a trailing /
+                folderPath = result.folderPath.rstrip('/')
+                folder = _DS_BRACKET_RE.match(folderPath).group(2).strip('/')
+                for path, directory in directories.items():
+                    if folder == directory or (recurse and (not directory or folder.startswith(directory + '/'))):
+                        res[path].extend((f"{folderPath}/{file.path}", file) for file in result.file)
+            return res
+
+        except Exception as e:
+            mylogger.exception(e)
+            raise myESXError(f'Error listing directories of datastore {dsname} at server {self.hostname}') from e
+
+    def lsFilesMany(self, queries:List[Tuple[str, str, str]], max_workers:int = 8) -> List[List[str]]:
+        """
+        Search several directories concurrently, for the cases lsFilesBatch does not cover (different datastores
+        or filters). Each search is a task waited for at the server, so they are run from a pool of threads.
+
+        :param queries: A list of tuples (dsname, directory_path, filter), as the arguments of _findFilesByName.
+        :param max_workers: Maximum number of searches running at the same time. Keep it low to respect the
+            limits of the server on concurrent requests per session.
+        :return: A list with the files found by each query, as _findFilesByName returns, in the order of queries.
+        :raises myESXError: The first error raised by a search, in the order of queries.
+        """
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as ex:
+            return list(ex.map(lambda query: self._findFilesByName(*query), queries))
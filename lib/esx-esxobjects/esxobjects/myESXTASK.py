@@ -2,68 +2,245 @@
 """This file manages high level operations on Vmware ESX Tasks."""
 
 import logging
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional
 mylogger = logging.getLogger()
 
 from .myESXError import myESXError, myESXWarning
 
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
+import asyncio
+import math
 import time
 
+# States of a task which has ended. Enum values read from the server are new str instances: compare them by value
+_ENDED_STATES = frozenset((vim.TaskInfo.State.success, vim.TaskInfo.State.error))
+
 class myESXTASK():
     """Class to handle basic operations on tasks like waiting for it to end."""
+
+    MIN_POLL_INTERVAL = 0.05
+    """This is the number of seconds wait() sleeps after the first poll. It grows by 1.5 on each poll up to poll_interval."""
+    INFO_MAX_AGE = 0.2
+    """This is the number of seconds the info of the task read from the server is reused by getName, isOK, etc."""
+
     def __init__(self, task:vim.Task, wait:bool = False, answer = None, timeout:float = None, poll_interval:float = 1.0):
         self.task:vim.Task = task
         self.answer = answer
+        # Last task.info read from the server, and when it was read (see _info)
+        self._infoCache:Optional[vim.TaskInfo] = None
+        self._infoRead:float = 0
         if wait:
-            self.wait(task, timeout, poll_interval)
+            self.wait(answer, timeout, poll_interval)
 
     def wait(self, answer = None, timeout_seconds:float = None, poll_interval:float = 1.0) -> vim.TaskInfo:
         """
         Waits for a VMware ESX task to complete within a specified timeout.
 
+        A single task is polled: for one task, it takes fewer round trips than setting up a PropertyCollector.
+        Use waitAll() to wait for several tasks at once.
+
         :param answer: Function to call when waiting for tasks over VMs to answer questions.
         :param timeout_seconds: Maximum time to wait for the task to complete, in seconds.
         :type timeout_seconds: float
-        :param poll_inrteval: Time to sleep between polls. Default is 1s.
-        :type poll_inrteval: float
+        :param poll_interval: Maximum time to sleep between polls: polls start every MIN_POLL_INTERVAL seconds,
+            so short tasks are noticed at once, and the interval grows up to poll_interval for long ones.
+            The answer function is called at most once every poll_interval. Default is 1s.
+        :type poll_interval: float
         
         :return: The task result if completed, None if the task did not complete within the timeout.
         :rtype: vim.TaskInfo or None
         """
         if answer:
             self.answer = answer
+        return self._poll(timeout_seconds, poll_interval)
+
+    async def wait_async(self, answer = None, timeout_seconds:float = None, poll_interval:float = 1.0) -> Optional[vim.TaskInfo]:
+        """
+        Coroutine waiting for the task to complete, for callers driving many tasks from an event loop.
+
+        The task is polled as in wait() when the server doesn't notify updates, but the event loop runs other
+        coroutines while sleeping between polls, and the API calls run in the default executor of the loop.
+        The parameters and the result are the same as in wait().
+        """
+        if answer:
+            self.answer = answer
+        loop = asyncio.get_running_loop()
+        start_time = time.monotonic()
+        interval = min(self.MIN_POLL_INTERVAL, poll_interval)
+        answered = -math.inf
+        info = await loop.run_in_executor(None, self._info, 0)
+        while info.state not in _ENDED_STATES:
+            self._logProgress(info)
+            # If answer handler was specified then answer questions, at most once every poll_interval
+            if self.answer and time.monotonic() - answered >= poll_interval:
+                answered = time.monotonic()
+                await loop.run_in_executor(None, self.answer)
+            # If timeout was specified then check if exceeded
+            if timeout_seconds != None:
+                if time.monotonic() - start_time > timeout_seconds:
+                    raise myESXWarning(f"Task {info.name} ({info.description}) didn't end before timeout expired.")
+            # Let other coroutines run before checking again, a bit longer each time
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, poll_interval)
+            info = await loop.run_in_executor(None, self._info, 0)
+        return self._result(info)
+
+    @staticmethod
+    def waitAll(tasks:List["myESXTASK"], timeout_seconds:float = None) -> List[bool]:
+        """
+        Wait for several tasks to end. Instead of polling each task, a PropertyCollector filter over all
+        of them is created, and each WaitForUpdatesEx call blocks at the server until some of them changes.
+        The updates carry the whole info of the tasks, which is kept, so reading the result afterwards
+        (isOK, getError...) needs no more round trips. A single task is polled instead, see wait().
+        If the server doesn't support the collector, the tasks are polled one after another.
+
+        For the tasks with an answer function, the question of the VM they run on is watched by the same
+        collector, and the function is called when the VM asks a question, instead of checking it periodically.
+
+        :param tasks: The tasks to wait for. They must belong to the same server connection.
+        :param timeout_seconds: Maximum time to wait for all the tasks to complete, in seconds.
+        :return: A list with True for each task ended with success, in the same order as tasks.
+        :raises myESXWarning: Raised if some task didn't end before the timeout expired.
+        """
+        if len(tasks) <= 1:
+            return [t._poll(timeout_seconds) is not None for t in tasks]
+        try:
+            collector = myESXTASK._createCollector(tasks[0].task)
+        except (vmodl.fault.NotSupported, vmodl.fault.MethodNotFound):
+            mylogger.debug("Server doesn't notify task updates, polling %d tasks.", len(tasks))
+            return myESXTASK._pollAll(tasks, timeout_seconds)
+        byTask = {t.task: t for t in tasks}
+        states:Dict[Any, str] = {}
+        # Answer functions by task, and by VM once the entity of the task is known
+        answers = {t.task: t.answer for t in tasks if t.answer}
+        vmAnswers:Dict[Any, List[Callable[[], Any]]] = {}
+        try:
+            objSpecs = [vmodl.query.PropertyCollector.ObjectSpec(obj=t.task) for t in tasks]
+            propSpec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info'])
+            collector.CreateFilter(vmodl.query.PropertyCollector.FilterSpec(objectSet=objSpecs, propSet=[propSpec]), partialUpdates=False)
+            start_time = time.monotonic()
+            version = ''
+            while any(states.get(t.task) not in _ENDED_STATES for t in tasks):
+                # Wake up when the timeout expires
+                maxWait = None
+                if timeout_seconds != None:
+                    remaining = timeout_seconds - (time.monotonic() - start_time)
+                    if remaining <= 0:
+                        pending = [t.getName() for t in tasks if states.get(t.task) not in _ENDED_STATES]
+                        raise myESXWarning(f"Tasks {pending} didn't end before timeout expired.")
+                    maxWait = max(1, math.ceil(remaining))
+                update = collector.WaitForUpdatesEx(version, vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=maxWait))
+                if update is None:
+                    continue
+                version = update.version
+                for filterUpdate in update.filterSet:
+                    for objUpdate in filterUpdate.objectSet:
+                        for change in objUpdate.changeSet:
+                            if change.name == 'info':
+                                info = change.val
+                                states[objUpdate.obj] = info.state
+                                # Keep the info, so the result is read without asking the server again
+                                task = byTask[objUpdate.obj]
+                                task._infoCache, task._infoRead = info, time.monotonic()
+                                if info.state not in _ENDED_STATES:
+                                    task._logProgress(info)
+                                if objUpdate.obj in answers and isinstance(info.entity, vim.VirtualMachine):
+                                    # Watch the question of the VM too. Its current value comes in the next update
+                                    if info.entity not in vmAnswers:
+                                        vmAnswers[info.entity] = []
+                                        questionSpec = vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine, pathSet=['runtime.question'])
+                                        collector.CreateFilter(vmodl.query.PropertyCollector.FilterSpec(
+                                            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=info.entity)], propSet=[questionSpec]), partialUpdates=True)
+                                    vmAnswers[info.entity].append(answers.pop(objUpdate.obj))
+                            elif change.name == 'runtime.question' and change.val is not None:
+                                # The VM asks a question: answer it
+                                for answer in vmAnswers.get(objUpdate.obj, []):
+                                    answer()
+        finally:
+            collector.DestroyPropertyCollector()
+        return [states[t.task] == vim.TaskInfo.State.success for t in tasks]
+
+    @staticmethod
+    def _createCollector(task:vim.Task) -> vmodl.query.PropertyCollector:
+        """Create a private PropertyCollector on the connection of the task, so its filters don't mix
+        with other users of the one of the connection. The caller must destroy it."""
+        content = vim.ServiceInstance('ServiceInstance', task._stub).content
+        return content.propertyCollector.CreatePropertyCollector()
+
+    @staticmethod
+    def _pollAll(tasks:List["myESXTASK"], timeout_seconds:float = None) -> List[bool]:
+        """Poll the tasks one after another, for servers which don't support waitAll. See waitAll."""
+        start_time = time.monotonic()
+        results = []
+        for t in tasks:
+            remaining = None if timeout_seconds is None else max(0, timeout_seconds - (time.monotonic() - start_time))
+            results.append(t._poll(remaining) is not None)
+        return results
+
+    def _poll(self, timeout_seconds:float = None, poll_interval:float = 1.0) -> vim.TaskInfo:
+        """Wait for the task polling its state. See wait."""
         # Starting time of task
-        start_time = time.time()
-        # Poll until task ends
-        while not self.isEnded():
-            # Print progress if possible
-            if self.task.info.progress != None and self.task.info.progress != "":
-                mylogger.debug(f"Waiting for task {self.task.info.name} ({self.task.info.description}): {self.task.info.progress}%")
-            else:
-                mylogger.debug(f"Waiting for task {self.task.info.name} ({self.task.info.description})")
-            # If answer handler was specified then answer questions
-            if self.answer:
+        start_time = time.monotonic()
+        interval = min(self.MIN_POLL_INTERVAL, poll_interval)
+        answered = -math.inf
+        # Poll until task ends. Reading task.info is an API call: read it once per poll
+        info = self._info(0)
+        while info.state not in _ENDED_STATES:
+            self._logProgress(info)
+            # If answer handler was specified then answer questions, at most once every poll_interval
+            if self.answer and time.monotonic() - answered >= poll_interval:
+                answered = time.monotonic()
                 self.answer()
             # If timeout was specified then check if exceeded            
             if timeout_seconds != None:
-                if time.time() - start_time > timeout_seconds:
-                    raise myESXWarning(f"Task {self.task.info.name} ({self.task.info.description}) didn't end before timeout expired.")
-            # Sleep for before checking again
-            time.sleep(poll_interval)
+                if time.monotonic() - start_time > timeout_seconds:
+                    raise myESXWarning(f"Task {info.name} ({info.description}) didn't end before timeout expired.")
+            # Sleep for before checking again, a bit longer each time
+            time.sleep(interval)
+            interval = min(interval * 1.5, poll_interval)
+            info = self._info(0)
 
-        if self.task.info.state == vim.TaskInfo.State.success:
-            return self.task.info
+        return self._result(info)
+
+    @staticmethod
+    def _logProgress(info:vim.TaskInfo):
+        """Print the progress of a running task if possible."""
+        if mylogger.isEnabledFor(logging.DEBUG):
+            if info.progress != None and info.progress != "":
+                mylogger.debug("Waiting for task %s (%s): %s%%", info.name, info.description, info.progress)
+            else:
+                mylogger.debug("Waiting for task %s (%s)", info.name, info.description)
+
+    @staticmethod
+    def _result(info:vim.TaskInfo) -> Optional[vim.TaskInfo]:
+        """Return the info of an ended task if it succeeded, else log its error and return None."""
+        if info.state == vim.TaskInfo.State.success:
+            return info
         else:
-            mylogger.error(f"Task failed with error: {self.getError()}")
+            mylogger.error("Task failed with error: %s", info.error.msg if info.error else None)
             return None
 
+    def _info(self, maxAge:float = None) -> vim.TaskInfo:
+        """Return the info of the task. Reading task.info fetches the whole TaskInfo from the server:
+        it is read again only if the last one is older than maxAge seconds (INFO_MAX_AGE by default).
+        The info of an ended task doesn't change anymore: it is only read again if maxAge is 0.
+
+        :param maxAge: Maximum age in seconds of the info returned. 0 always reads it again.
+        """
+        if maxAge is None:
+            maxAge = math.inf if self._infoCache is not None and self._infoCache.state in _ENDED_STATES else self.INFO_MAX_AGE
+        now = time.monotonic()
+        if self._infoCache is None or now - self._infoRead >= maxAge:
+            self._infoCache = self.task.info
+            self._infoRead = now
+        return self._infoCache
+
     def getName(self) -> str:
         """Returns the name of the task.
 
         :return: A string with the name of the task.
         """
-        return self.task.info.name
+        return self._info().name
 
     def getError(self) ->Optional[str]:
         """Returns description of the error.
@@ -71,7 +248,7 @@ class myESXTASK():
         :return: A string describing the error.
         """
         if self.isFailed():
-            return self.task.info.error.msg
+            return self._info().error.msg
         else:
             return None
 
@@ -80,19 +257,19 @@ class myESXTASK():
 
         :return: True if task ended.
         """
-        return self.task.info.state in [vim.TaskInfo.State.success, vim.TaskInfo.State.error]
+        return self._info().state in _ENDED_STATES
 
     def isOK(self) -> bool:
         """Checks if task succeedded.
 
                 :return: True if result was success.
         """
-        return self.task.info.state == vim.TaskInfo.State.success
+        return self._info().state == vim.TaskInfo.State.success
     
     def isFailed(self) -> bool:
         """Checks if task failed.
 
         :return: True if result was error.
         """
-        return self.task.info.state == vim.TaskInfo.State.error
+        return self._info().state == vim.TaskInfo.State.error
     
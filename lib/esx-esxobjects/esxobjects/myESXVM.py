@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 """This module provides an object to implement several operations on VMWare ESX virtual machines using the pyvmomi API. This file is part if the myESX library."""
 
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 from pyVmomi import vim
 
 # Initialize logger
@@ -12,21 +12,35 @@ mylogger = logging.getLogger()
 from .myESXTASK import myESXTASK
 from .myESXError import myESXError, myESXWarning
 
-import re, datetime, time
+import re, datetime
+
+# Splits the datastore path of a VMX file into directory and file name
+_VMX_RE = re.compile(r'(.*)/([^/]+\.vmx)$')
 
 class myESXVM:
     """This object manages VM objects through a ESXAPI object"""
 
-    def __init__(self, vm:vim.VirtualMachine):
+    def __init__(self, vm:vim.VirtualMachine, name:Optional[str] = None):
         """Wrap a vim.VirtualMachine object with this object to provide high level functions.
+
+        :param vm: The VM object.
+        :param name: The name of the VM, if already known (e.g. fetched in bulk with the list of VMs).
+            It is then returned by getName() without asking the server.
         """
         self.vm:vim.VirtualMachine = vm
+        self._name:Optional[str] = name
+        # Id of the last question answerManually warned about
+        self._warnedQuestion:Optional[str] = None
+        # Directory and name of the VMX file, read on first use
+        self._vmxLocation:Optional[Tuple[str, str]] = None
 
     def getName(self) -> str:
         """Get the label of the VM.
         
         Returns a string with the name of the VM."""
-        return self.vm.name
+        if self._name is None:
+            self._name = self.vm.name
+        return self._name
 
     def rename(self, newName:str):
         """Set a new label for a VM.
@@ -40,8 +54,11 @@ class myESXVM:
         try:
             task = myESXTASK ( self.vm.Reconfigure(spec=spec) )
         except Exception as e:
-            raise myESXError(f'Error renaming VM {self.vm.name}') from e
+            raise myESXError(f'Error renaming VM {self.getName()}') from e
 
+        # Read the name and the VMX file from the server again next time
+        self._name = None
+        self._vmxLocation = None
         return self.vm.name
     
     def reconfigRes(self, config:vim.vm.ConfigSpec) -> myESXTASK:
@@ -52,7 +69,9 @@ class myESXVM:
         try:
             task = myESXTASK ( self.vm.Reconfigure(spec=config) )
         except Exception as e:
-            raise myESXError(f'Error reconfiguring VM {self.vm.name}') from e
+            raise myESXError(f'Error reconfiguring VM {self.getName()}') from e
+        # The spec may change files of the VM: read the VMX file from the server again next time
+        self._vmxLocation = None
         return task
     
     def getHost(self) -> vim.ComputeResource:
@@ -64,12 +83,12 @@ class myESXVM:
     def unregister(self):
         """Unregister VM without removing machine.
         """
-        name = self.vm.name
+        name = self.getName()
         if self.vm.runtime.powerState == 'poweredOn':
             raise myESXError(f'Error unregistering VM {name} in power on state.')
         try:
             self.vm.UnregisterVM() # type: ignore
-            mylogger.debug(f'Unregistered VM {name}')
+            mylogger.debug('Unregistered VM %s', name)
         except Exception as e:
             raise myESXError(f'Error unregistering VM {name}') from e
 
@@ -79,79 +98,69 @@ class myESXVM:
         """
 
         # Move VM into pool
+        name = self.getName()
         try:
-            mylogger.debug(f'Moving vm {self.getName()} into pool {pool}')
+            mylogger.debug('Moving vm %s into pool %s', name, pool)
             pool.MoveInto([self.vm])
         except Exception as e:
-            raise myESXError(f'Error moving VM {self.getName()} into ') from e
+            raise myESXError(f'Error moving VM {name} into {pool}') from e
 
     def managePower(self, operation:str) -> myESXTASK | str:
         """Manage power states of the VM
 
         - operation: Operation is one of on, off, reset, shutdown, reboot, status
         """
+        # Keep the last known power state for the error message: asking the server again may fail too
+        powerState = 'unknown'
         try:
-            task = None
-            # Decode operation and call function
-            match (operation):
-                ##############################################
-                # These operations return a task (default answer to questions is to manually cancel in UI)
-                # wait() can specify a different method of cancelling
-                case 'on':
-                    if self.vm.runtime.powerState != 'poweredOn':
-                        task = myESXTASK( task=self.vm.PowerOn(None), answer=self.answerManually )
-                case 'off':
-                    if self.vm.runtime.powerState == 'poweredOn':
-                        task = myESXTASK( task=self.vm.PowerOff(), answer=self.answerManually )
-                case 'reset':
-                    if self.vm.runtime.powerState == 'poweredOn':
-                        task = myESXTASK( task=self.vm.Reset(), answer=self.answerManually )
-
-                case 'shutdown':
-                    if self.vm.runtime.powerState == 'poweredOn':
-                        self.vm.ShutdownGuest()
-                case 'reboot':
-                    if self.vm.runtime.powerState == 'poweredOn':
-                        self.vm.RebootGuest()
-                case 'status':
-                    pass
-                
-            if task:
-                return task
-            else:
-                return self.vm.runtime.powerState
+            # Reading runtime is an API call: read the power state once for all the checks
+            powerState = self.vm.runtime.powerState
+            # Decode operation and call function. Unknown operations, like status, just return the power state
+            handler = self._POWER_OPS.get(operation)
+            result = handler(self, powerState) if handler else None
+            return result if result else powerState
         except Exception as e:
-            raise myESXError(f'Error changing power state of VM {self.vm.name} ({self.vm._moId}) from {self.vm.runtime.powerState} to {operation}') from e
+            raise myESXError(f'Error changing power state of VM {self.getName()} ({self.vm._moId}) from {powerState} to {operation}') from e
+
+    def currentSnapshotRef(self) -> Optional[vim.vm.Snapshot]:
+        """Obtains the managed object of the current snapshot of the VM, without walking the snapshot tree.
+        It is enough to revert to or remove the snapshot, but has no name nor description.
+
+        :return: The current snapshot, or None if there are no snapshots."""
+        snapshotInfo = self.vm.snapshot
+        return snapshotInfo.currentSnapshot if snapshotInfo else None
 
     def currentSnapshot(self) -> Optional[vim.vm.SnapshotTree]:
         """Obtains the current snapshot of the VM.
 
         :return: A list with the current snapshot, or an empty list if there are no snapshots."""
 
-        current_MoID = self._currentSnapshot_moID()
-        for snapshot in self.listSnapshots():
-            if snapshot.snapshot._GetMoId() == current_MoID:
-                return snapshot
-        return None
+        # Reading vm.snapshot is an API call: read it once for both the current snapshot and the tree
+        snapshotInfo = self.vm.snapshot
+        if not snapshotInfo or not snapshotInfo.currentSnapshot:
+            return None
+        _, byMoId, _ = self._index_snapshots(snapshotInfo.rootSnapshotList)
+        return byMoId.get(str(snapshotInfo.currentSnapshot._moId))
 
     def snapshotByName(self, name: str) -> Optional[vim.vm.SnapshotTree]:
         """Obtains a list with a snapshot with the given name.
         
         :return: A list with the snapshot with the name, or an empty list if not found."""
-        snapshotList:List[vim.vm.SnapshotTree] = self.listSnapshots()
-        for snapshot in snapshotList:
-            if snapshot.name == name:
-                return snapshot
-        return None
+        snapshotInfo = self.vm.snapshot
+        if not snapshotInfo:
+            return None
+        _, _, byName = self._index_snapshots(snapshotInfo.rootSnapshotList)
+        return byName.get(name)
 
     def listSnapshots(self) -> List[vim.vm.SnapshotTree]:
         """Obtains a list with all snapshots.
         
         Returns a list with all snapshots or an empty list if none is found."""
-        if not self.vm.snapshot:
-            mylogger.debug(f"No snapshots found for VM '{self.vm.name}'.")
+        snapshotInfo = self.vm.snapshot
+        if not snapshotInfo:
+            mylogger.debug("No snapshots found for VM '%s'.", self.getName())
             return []
-        return self._list_snapshots_recursive(self.vm.snapshot.rootSnapshotList)  
+        return self._index_snapshots(snapshotInfo.rootSnapshotList)[0]
 
     def listDevices(self) -> List[vim.vm.device.VirtualDevice]:
         if self.vm.config:
@@ -192,102 +201,177 @@ class myESXVM:
         """
         try:
             # Decode snapshot operation and call function on VM
-            match (operation):
-                case 'current':
-                    current = self.currentSnapshot()
-                    if current:
-                        return ([current],None)
-                    else:
-                        return ([],None)
-                case 'ls':
-                    return (self.listSnapshots(),None)
-                case 'create':
-                    return ([],self.createSnapshot(label, ""))
-                case 'rm':
-                    snapshot = self.snapshotByName(label)
-                    if snapshot:
-                        return ([],self.rmSnapshot(snapshot=snapshot))
-                    else:
-                        mylogger.error(f'snapshot {label} not found')
-                        return ([],None)
-                case 'revert':
-                    snapshot = self.snapshotByName(label)
-                    if snapshot:
-                        return ([],self.revertSnapshot(snapshot=snapshot))
-                    else:
-                        mylogger.error(f'snapshot {label} not found')
-                        return ([],None)
+            handler = self._SNAPSHOT_OPS.get(operation)
+            if handler:
+                return handler(self, label)
             # Should not happen                    
-            raise myESXError(f'Unknow snapshot operation {self.vm.name} ({self.vm._moId}). op={operation}')
+            raise myESXError(f'Unknow snapshot operation {self.getName()} ({self.vm._moId}). op={operation}')
 
         except Exception as e:
-            raise myESXError(f'Error operating on snapshot of {self.vm.name} ({self.vm._moId}). op={operation}') from e
+            raise myESXError(f'Error operating on snapshot of {self.getName()} ({self.vm._moId}). op={operation}') from e
+
+    ##############################################
+    # Power operations of managePower. They receive the current power state, and return a task,
+    # the new power state, or None if there was nothing to do.
+    # The tasks use the default answer to questions: manually cancel in UI. wait() can specify a different method of cancelling
+    def _powerOn(self, powerState:str) -> Optional[myESXTASK]:
+        if powerState != 'poweredOn':
+            return myESXTASK( task=self.vm.PowerOn(None), answer=self.answerManually )
+        return None
+
+    def _powerOff(self, powerState:str) -> Optional[myESXTASK]:
+        if powerState == 'poweredOn':
+            return myESXTASK( task=self.vm.PowerOff(), answer=self.answerManually )
+        return None
+
+    def _powerReset(self, powerState:str) -> Optional[myESXTASK]:
+        if powerState == 'poweredOn':
+            return myESXTASK( task=self.vm.Reset(), answer=self.answerManually )
+        return None
+
+    def _powerShutdown(self, powerState:str) -> Optional[str]:
+        if powerState == 'poweredOn':
+            self.vm.ShutdownGuest()
+            return self.vm.runtime.powerState
+        return None
+
+    def _powerReboot(self, powerState:str) -> Optional[str]:
+        if powerState == 'poweredOn':
+            self.vm.RebootGuest()
+            return self.vm.runtime.powerState
+        return None
+
+    _POWER_OPS = {
+        'on': _powerOn,
+        'off': _powerOff,
+        'reset': _powerReset,
+        'shutdown': _powerShutdown,
+        'reboot': _powerReboot,
+    }
+    """Handlers of the operations of managePower."""
+
+    ##############################################
+    # Snapshot operations of manageSnapshots. They receive the label, and return a tuple (snapshots, task)
+    def _snapshotCurrent(self, label:str) -> Tuple[List[vim.vm.SnapshotTree],Optional[myESXTASK]]:
+        current = self.currentSnapshot()
+        if current:
+            return ([current],None)
+        else:
+            return ([],None)
+
+    def _snapshotList(self, label:str) -> Tuple[List[vim.vm.SnapshotTree],Optional[myESXTASK]]:
+        return (self.listSnapshots(),None)
+
+    def _snapshotCreate(self, label:str) -> Tuple[List[vim.vm.SnapshotTree],Optional[myESXTASK]]:
+        return ([],self.createSnapshot(label, ""))
+
+    def _snapshotRemove(self, label:str) -> Tuple[List[vim.vm.SnapshotTree],Optional[myESXTASK]]:
+        snapshot = self.snapshotByName(label)
+        if snapshot:
+            return ([],self.rmSnapshot(snapshot=snapshot))
+        else:
+            mylogger.error('snapshot %s not found', label)
+            return ([],None)
+
+    def _snapshotRevert(self, label:str) -> Tuple[List[vim.vm.SnapshotTree],Optional[myESXTASK]]:
+        snapshot = self.snapshotByName(label)
+        if snapshot:
+            return ([],self.revertSnapshot(snapshot=snapshot))
+        else:
+            mylogger.error('snapshot %s not found', label)
+            return ([],None)
+
+    _SNAPSHOT_OPS = {
+        'current': _snapshotCurrent,
+        'ls': _snapshotList,
+        'create': _snapshotCreate,
+        'rm': _snapshotRemove,
+        'revert': _snapshotRevert,
+    }
+    """Handlers of the operations of manageSnapshots."""
 
     def listSnapshotDiskLayout(self, ident:str = ""):
         """Lists the disk layout of the current snapshot of this VM."""
-        print(f'{ident} SNAPSHOT LIST for {self.vm.name}')
-        for snapshot in self.vm.layoutEx.snapshot: # type: ignore
-            print(self._listSnapshotDisks(self.vm.layoutEx.file, snapshot, ident+"  ")) # type: ignore
+        print(f'{ident} SNAPSHOT LIST for {self.getName()}')
+        # Reading layoutEx is an API call: read it once for all the snapshots
+        layout = self.vm.layoutEx
+        for snapshot in layout.snapshot: # type: ignore
+            print(self._listSnapshotDisks(layout.file, snapshot, ident+"  ")) # type: ignore
 
     def listDiskLayout(self, ident:str = ""):
         """Lists the current disk layout of this VM."""
-        print(self._listDisks(self.vm.layoutEx.file, self.vm.layoutEx.disk, ident)) # type: ignore
+        layout = self.vm.layoutEx
+        print(self._listDisks(layout.file, layout.disk, ident)) # type: ignore
 
     # Helper function to get moID of current snapshot
     def _currentSnapshot_moID(self) -> str:
         """Helper function to get moID of current snapshot
         
         Returns moId of current snapshot"""
-        if self.vm.snapshot and self.vm.snapshot.currentSnapshot:
-            return str(self.vm.snapshot.currentSnapshot._moId)
-        else:
-            return ''
-
-    def _list_snapshots_recursive(self, snapshot_tree: List[vim.vm.SnapshotTree]) -> List[vim.vm.SnapshotTree]:
-        """Helper function to build a list from the tree of snapshots.
-
-        :return: A list through a depth-first search of the snapshot tree."""
-        resList = []
-        for snapshot in snapshot_tree:
+        current = self.currentSnapshotRef()
+        return str(current._moId) if current else ''
+
+    def _index_snapshots(self, snapshot_tree: List[vim.vm.SnapshotTree]) -> Tuple[List[vim.vm.SnapshotTree], Dict[str, vim.vm.SnapshotTree], Dict[str, vim.vm.SnapshotTree]]:
+        """Helper function to build a list and indexes from the tree of snapshots, in a single pass.
+
+        :return: A tuple with a list through a depth-first search of the snapshot tree, and dictionaries of
+            the snapshots by moId and by name. If several snapshots have the same name, the first one in the list is indexed."""
+        resList:List[vim.vm.SnapshotTree] = []
+        byMoId:Dict[str, vim.vm.SnapshotTree] = {}
+        byName:Dict[str, vim.vm.SnapshotTree] = {}
+        # Explicit stack instead of recursion, reversed to visit the snapshots in the order of the tree
+        stack = list(reversed(snapshot_tree))
+        while stack:
+            snapshot = stack.pop()
             resList.append(snapshot)
+            byMoId[str(snapshot.snapshot._moId)] = snapshot
+            byName.setdefault(snapshot.name, snapshot)
             if snapshot.childSnapshotList:
-                for sub_snapshot in self._list_snapshots_recursive(snapshot.childSnapshotList):
-                   resList.append(sub_snapshot)
-        return resList
+                stack.extend(reversed(snapshot.childSnapshotList))
+        return resList, byMoId, byName
 
     # Helper function to get the full path of the VMX file of a machine
     def _get_vmx_path(self) -> str:
         """Helper function to get the full path of the VMX file of a machine.
         
         Returns an string with the path of the VMX file of this Virtual Machine."""
-        tmp = [f.name for f in self.vm.layoutEx.file if f.type=='config'] # type: ignore
-        vmx_file = tmp.pop()
-        m = re.match(r'(.*)/[^/]+.vmx$', vmx_file)
-        if not m:
-            raise myESXError(f'VM Path could not be extracted from VMX pathname of VM {self.getName()}')
-        else:
-            return m.group(1)
+        return self._get_vmx_location()[0]
+
+    def _get_vmx_location(self) -> Tuple[str, str]:
+        """Helper function to get the directory and the name of the VMX file of a machine.
+
+        Returns a tuple with the path of the directory and the filename of the VMX file of this Virtual Machine."""
+        if self._vmxLocation is None:
+            # The last config file, as before: scan from the end and stop at the first one
+            vmx_file = next((f.name for f in reversed(self.vm.layoutEx.file) if f.type=='config'), None) # type: ignore
+            if vmx_file is None:
+                raise myESXError(f'No VMX file found in the layout of VM {self.getName()}')
+            m = _VMX_RE.match(vmx_file)
+            if not m:
+                raise myESXError(f'VM Path could not be extracted from VMX pathname of VM {self.getName()}')
+            # The VMX file does not move unless the VM is relocated: remember it
+            self._vmxLocation = m.group(1), m.group(2)
+        return self._vmxLocation
 
     def _listDisks(self, files, disks, ident:str = "") -> str:
         """Helper function to convert to text the chain of overlays for each disk of a VM.
 
         Returns a string listing snapshots through a depth-first search of the tree."""
-        result = ""
+        parts = []
         for disk in disks:
-            result += ident + "DISK Layout (key="+str(disk.key)+")\n"
+            parts.append(f"{ident}DISK Layout (key={disk.key})\n")
             for overlay in disk.chain:
-                result += ident + "  -Overlay:\n"
+                parts.append(f"{ident}  -Overlay:\n")
                 for fileidx in overlay.fileKey:
-                    result += ident + "    +"+files[fileidx].type+" "+str(files[fileidx].size)+" "+files[fileidx].name + '\n'
-        return result
+                    f = files[fileidx]
+                    parts.append(f"{ident}    +{f.type} {f.size} {f.name}\n")
+        return ''.join(parts)
 
     def _listSnapshotDisks(self, files, snapshot, ident="") -> str:
         """Helper function to recursively list the snapshots of a disk.
         
         Returns a string listing the snapshots of a disk."""
-        result = ident + "SNAPSHOT Disk Layout (key="+str(snapshot.key)+")\n"
-        result += self._listDisks(files, snapshot.disk, ident+"  ")
-        return result
+        return f"{ident}SNAPSHOT Disk Layout (key={snapshot.key})\n" + self._listDisks(files, snapshot.disk, ident+"  ")
 
     #######################################################################
     # VM Questions
@@ -311,7 +395,7 @@ class myESXVM:
         """Answer a VM's question."""
         question = self.vm.runtime.question
         if not question:
-            mylogger.debug(f'VM {self.vm.name} has no question to answer.')
+            mylogger.debug('VM %s has no question to answer.', self.getName())
             return
 
         # If message is None answer any question. If specified, check that the question matches the given message
@@ -332,7 +416,7 @@ class myESXVM:
             self.vm.Answer(question.id, choice)
             return True
         else:
-            mylogger.error(f'Answering wrong question for vm {self.vm.name}. Question={question.message[0].text}')
+            mylogger.error(f'Answering wrong question for vm {self.getName()}. Question={question.message[0].text}')
 
     # Question regarding Moving or Copying VM to change MACs
     question_about_macs = 'This virtual machine might have been moved or copied. In order to configure certain management and networking features, VMware ESX needs to know if this virtual machine was moved or copied. If you don\'t know, answer "I Copied It". '
@@ -354,7 +438,11 @@ class myESXVM:
         self._answerQuestion('', '')
 
     def answerManually(self):
-        """In case of waiting for any question warn to go to the VI Client and answer interactively."""
-        if self._waitsQuestion():
+        """In case of waiting for any question warn to go to the VI Client and answer interactively.
+
+        It does not block: the task wait keeps watching the task, and notices as soon as the question
+        is answered. The warning is logged once per question."""
+        question = self._checkQuestion()
+        if question and question.id != self._warnedQuestion:
+            self._warnedQuestion = question.id
             mylogger.warning(f"VM {self.getName()}@{self.getHost().name} is waiting for a Question. Go to the ESX console, answer it and come back. **DO NOT INTERRUPT** THIS PROGRAM.")
-            time.sleep(10)
@@ -0,0 +1,148 @@
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from pyVmomi import vim, vmodl
+
+from esxobjects.myESXTASK import myESXTASK
+from esxobjects.myESXError import myESXWarning
+
+# The tests run without a server: tasks and the PropertyCollector are fakes,
+# the infos are real vim.TaskInfo objects.
+
+RUNNING = vim.TaskInfo.State.running
+SUCCESS = vim.TaskInfo.State.success
+ERROR = vim.TaskInfo.State.error
+
+
+class FakeTask(vim.Task):
+    """A vim.Task without a server: each read of info returns the next one, and is counted."""
+    _ids = itertools.count(1)
+
+    def __init__(self, *infos):
+        super().__init__(f"task-{next(self._ids)}")
+        self._infos = list(infos)
+        self.reads = 0
+
+    @property
+    def info(self):
+        self.reads += 1
+        return self._infos.pop(0) if len(self._infos) > 1 else self._infos[0]
+
+
+class FakeCollector:
+    """Stands for a private PropertyCollector, returning the given updates in order."""
+    def __init__(self, updates):
+        self.updates = list(updates)
+        self.filters = []
+        self.destroyed = False
+
+    def CreateFilter(self, spec, partialUpdates):
+        self.filters.append([o.obj for o in spec.objectSet])
+
+    def WaitForUpdatesEx(self, version, options):
+        return self.updates.pop(0) if self.updates else None
+
+    def DestroyPropertyCollector(self):
+        self.destroyed = True
+
+
+def info(state, entity=None, error=None):
+    return vim.TaskInfo(state=state, key="task", entity=entity, error=error)
+
+
+def update(version, *objects):
+    """An update of the collector: objects are (obj, name, value) tuples."""
+    return SimpleNamespace(version=version, filterSet=[SimpleNamespace(objectSet=[
+        SimpleNamespace(obj=obj, changeSet=[SimpleNamespace(name=name, val=val)]) for obj, name, val in objects])])
+
+
+@pytest.fixture(autouse=True)
+def fast_polls(monkeypatch):
+    monkeypatch.setattr(myESXTASK, "MIN_POLL_INTERVAL", 0.001)
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    """Install a FakeCollector; set its updates with collector.updates."""
+    fake = FakeCollector([])
+    monkeypatch.setattr(myESXTASK, "_createCollector", staticmethod(lambda task: fake))
+    return fake
+
+
+def test_wait_polls_a_single_task(collector):
+    task = FakeTask(info(RUNNING), info(RUNNING), info(SUCCESS))
+    result = myESXTASK(task).wait()
+    assert result.state == SUCCESS
+    assert task.reads == 3
+    # No collector is set up for a single task
+    assert collector.filters == []
+
+
+def test_wait_returns_none_on_error():
+    task = FakeTask(info(ERROR, error=vmodl.MethodFault(msg="boom")))
+    t = myESXTASK(task)
+    assert t.wait() is None
+    assert t.getError() == "boom"
+    # The info of the ended task is reused
+    assert task.reads == 1
+
+
+def test_wait_timeout():
+    task = FakeTask(info(RUNNING))
+    with pytest.raises(myESXWarning):
+        myESXTASK(task).wait(timeout_seconds=0.01)
+
+
+def test_waitAll_single_task_polls(collector):
+    task = FakeTask(info(RUNNING), info(SUCCESS))
+    assert myESXTASK.waitAll([myESXTASK(task)]) == [True]
+    assert collector.filters == []
+
+
+def test_waitAll_reuses_the_final_update(collector):
+    t1, t2 = FakeTask(info(RUNNING)), FakeTask(info(RUNNING))
+    collector.updates = [
+        update("1", (t1, "info", info(RUNNING)), (t2, "info", info(ERROR, error=vmodl.MethodFault(msg="boom")))),
+        update("2", (t1, "info", info(SUCCESS))),
+    ]
+    a, b = myESXTASK(t1), myESXTASK(t2)
+    assert myESXTASK.waitAll([a, b]) == [True, False]
+    assert collector.filters == [[t1, t2]]
+    assert collector.destroyed
+    # The result comes from the updates, without reading task.info
+    assert a.isOK() and b.isFailed() and b.getError() == "boom"
+    assert t1.reads == t2.reads == 0
+
+
+def test_waitAll_answers_questions(collector):
+    vm = vim.VirtualMachine("vm-1")
+    t1, t2 = FakeTask(info(RUNNING)), FakeTask(info(RUNNING))
+    collector.updates = [
+        update("1", (t1, "info", info(RUNNING, entity=vm)), (t2, "info", info(SUCCESS))),
+        update("2", (vm, "runtime.question", None)),
+        update("3", (vm, "runtime.question", "question")),
+        update("4", (t1, "info", info(SUCCESS, entity=vm))),
+    ]
+    answered = []
+    a, b = myESXTASK(t1, answer=lambda: answered.append(1)), myESXTASK(t2)
+    assert myESXTASK.waitAll([a, b]) == [True, True]
+    # The question of the VM is watched once, and answered when asked
+    assert collector.filters == [[t1, t2], [vm]]
+    assert answered == [1]
+
+
+def test_waitAll_timeout(collector):
+    t1, t2 = FakeTask(info(RUNNING)), FakeTask(info(RUNNING))
+    collector.updates = [update("1", (t1, "info", info(RUNNING)), (t2, "info", info(SUCCESS)))]
+    with pytest.raises(myESXWarning):
+        myESXTASK.waitAll([myESXTASK(t1), myESXTASK(t2)], timeout_seconds=0.01)
+    assert collector.destroyed
+
+
+def test_waitAll_polls_when_not_supported(monkeypatch):
+    def not_supported(task):
+        raise vmodl.fault.NotSupported()
+    monkeypatch.setattr(myESXTASK, "_createCollector", staticmethod(not_supported))
+    t1, t2 = FakeTask(info(RUNNING), info(SUCCESS)), FakeTask(info(ERROR))
+    assert myESXTASK.waitAll([myESXTASK(t1), myESXTASK(t2)]) == [True, False]
@@ -24,7 +24,15 @@ class VMConfigModel(BaseModel):
 class VMInfoModel(VMConfigModel):
     id: str
     status: str = Field(default="stopped")
-from common.app_setup import setup_logging
+
+# Input models for the batch endpoints
+class VMIdsModel(BaseModel):
+    ids: list[str]
+
+class VMBatchActionModel(VMIdsModel):
+    action: str
+
+from common.app_setup import setup_logging, stop_logging
 
 # Set up logging for the daemon
 logger = setup_logging(app_name="univor", daemon=True)
@@ -77,15 +85,30 @@ def status():
     return {"status": state, "vms": len(mock_vms)}
 
 
-@app.post("/vms", response_model=VMInfoModel, status_code=201)
-def create_vm(vm: VMConfigModel) -> VMInfoModel:
-    if not isinstance(vm.name, str) or not vm.name.strip():
-        logger.warning(f"Invalid VM name: {vm.name!r}")
+def _check_new_vm_name(name: str | None, existing_names: set) -> None:
+    """Raise an HTTPException if name is not valid for a new VM."""
+    if not isinstance(name, str) or not name.strip():
+        logger.warning(f"Invalid VM name: {name!r}")
         raise HTTPException(status_code=422, detail="Missing or invalid 'name' field")
-    existing_names = {existing_vm.name for existing_vm in mock_vms.values()}
-    if vm.name in existing_names:
-        logger.warning(f"Duplicate VM name: {vm.name!r}")
+    if name in existing_names:
+        logger.warning(f"Duplicate VM name: {name!r}")
         raise HTTPException(status_code=409, detail="VM with this name already exists")
+
+def _get_vms(vm_ids: list[str]) -> list[VMInfoModel]:
+    """Return the VMs with the given ids, or raise 404 if any is missing."""
+    missing = [vm_id for vm_id in vm_ids if vm_id not in mock_vms]
+    if missing:
+        logger.warning(f"VMs not found: {missing}")
+        raise HTTPException(status_code=404, detail=f"VMs not found: {missing}")
+    return [mock_vms[vm_id] for vm_id in vm_ids]
+
+@app.post("/vms", response_model=VMInfoModel, status_code=201)
+def create_vm(vm: VMConfigModel) -> VMInfoModel:
+    _check_new_vm_name(vm.name, {existing_vm.name for existing_vm in mock_vms.values()})
+    return _create_vm(vm)
+
+def _create_vm(vm: VMConfigModel) -> VMInfoModel:
+    """Store a new VM, whose name has already been checked."""
     vm_id = generate_vm_id(None)
     vm_info = VMInfoModel(
         id=vm_id,
@@ -98,6 +121,37 @@ def create_vm(vm: VMConfigModel) -> VMInfoModel:
     logger.info(f"Created VM: {vm_info}")
     return vm_info
 
+@app.post("/vms:batch", response_model=list[VMInfoModel], status_code=201)
+def create_vms(vms: list[VMConfigModel]) -> list[VMInfoModel]:
+    """Create several VMs in one request. If any config is invalid, none is created."""
+    names = {existing_vm.name for existing_vm in mock_vms.values()}
+    for vm in vms:
+        _check_new_vm_name(vm.name, names)
+        names.add(vm.name)
+    return [_create_vm(vm) for vm in vms]
+
+@app.post("/vms:batch-delete", status_code=204)
+def delete_vms(batch: VMIdsModel):
+    """Delete several VMs by ID. If any VM is not found, none is deleted."""
+    _get_vms(batch.ids)
+    for vm_id in batch.ids:
+        mock_vms.pop(vm_id, None)
+    logger.info(f"Deleted VMs: {batch.ids}")
+
+@app.post("/vms:batch-action", response_model=list[VMInfoModel])
+def vms_lifecycle(batch: VMBatchActionModel) -> list[VMInfoModel]:
+    """Apply the same lifecycle action to several VMs.
+    If any VM is not found, or can't do the action in its status, none is changed."""
+    new_status = _lifecycle_status(batch.action)
+    vms = _get_vms(batch.ids)
+    # Check all the VMs before changing any
+    for vm in vms:
+        _check_lifecycle(batch.action, vm)
+    for vm in vms:
+        vm.status = new_status
+    logger.info(f"VMs {batch.ids} lifecycle action '{batch.action}' -> status '{new_status}'")
+    return vms
+
 @app.get("/vms", response_model=list[VMInfoModel])
 def list_vms(search: str | None = None) -> list[VMInfoModel]:
     """List all VMs, or filter by name if 'search' is provided."""
@@ -176,18 +230,39 @@ def vm_lifecycle(vm_id: str, action: str):
     vm = mock_vms.get(vm_id)
     if not vm:
         raise HTTPException(status_code=404, detail="VM not found")
-    if action not in ["start", "stop", "pause", "resume"]:
-        raise HTTPException(status_code=400, detail="Invalid action")
-    new_status = {
-        "start": "running",
-        "stop": "stopped",
-        "pause": "paused",
-        "resume": "running"
-    }[action]
+    new_status = _lifecycle_status(action)
+    _check_lifecycle(action, vm)
     vm.status = new_status
     logger.info(f"VM {vm_id} lifecycle action '{action}' -> status '{new_status}'")
     return vm
-    #TODO: implement lifecycle logic: FSM
+
+# Status of a VM after each lifecycle action
+LIFECYCLE_STATUS = {
+    "start": "running",
+    "stop": "stopped",
+    "pause": "paused",
+    "resume": "running"
+}
+
+# Statuses of a VM each lifecycle action can be applied to
+LIFECYCLE_FROM = {
+    "start": {"stopped"},
+    "stop": {"running", "paused"},
+    "pause": {"running"},
+    "resume": {"paused"}
+}
+
+def _lifecycle_status(action: str) -> str:
+    """Return the status a lifecycle action leads to, or raise 400 if unknown."""
+    if action not in LIFECYCLE_STATUS:
+        raise HTTPException(status_code=400, detail="Invalid action")
+    return LIFECYCLE_STATUS[action]
+
+def _check_lifecycle(action: str, vm: VMInfoModel) -> None:
+    """Raise 409 if a known lifecycle action can't be applied in the current status of vm."""
+    if vm.status not in LIFECYCLE_FROM[action]:
+        logger.warning(f"VM {vm.id}: cannot {action} a VM in status '{vm.status}'")
+        raise HTTPException(status_code=409, detail=f"Cannot {action} a VM in status '{vm.status}'")
 
 import socket
 import typer
@@ -197,22 +272,24 @@ app_cli = typer.Typer()
 @app_cli.command()
 def run(port: int = typer.Option(None, help="Port to run the server on (auto if not set)")):
     """Run the FastAPI app using Uvicorn on localhost, reporting the actual port used."""
+    # Bind the listening socket here and hand it to Uvicorn, so the reported port
+    # is the one actually served: no window for another process to take it.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     if port is None or port == 0:
-        # Bind to port 0 to get a free port, then close and reuse
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind(('127.0.0.1', 0))
-            port = s.getsockname()[1]
+        # Port 0: the OS picks a free port
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
         logger.info(f"Selected port: {port}")
         print(json.dumps({"event": "port_selected", "port": port}), flush=True)
     else:
-        # Check if port is available
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind(('127.0.0.1', port))
-            except OSError:
-                logger.error(f"ERROR: Port {port} is already in use.")
-                import sys
-                sys.exit(98)  # 98 = EADDRINUSE
+        # Bind the requested port, failing if it is already in use
+        try:
+            sock.bind(('127.0.0.1', port))
+        except OSError:
+            logger.error(f"ERROR: Port {port} is already in use.")
+            import sys
+            sys.exit(98)  # 98 = EADDRINUSE
         logger.info(f"Using port: {port}")
         print(json.dumps({"event": "port_used", "port": port}), flush=True)
     config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="info")
@@ -220,10 +297,11 @@ def run(port: int = typer.Option(None, help="Port to run the server on (auto if
     app.state.uvicorn_server = server  # Store server instance for shutdown
     logger.info(f"Starting Uvicorn server on port {port}")
     try:
-        server.run()
+        server.run(sockets=[sock])
     except KeyboardInterrupt:
         logger.info("KeyboardInterrupt in main thread")
     logger.info("Server stopped, exiting process")
+    stop_logging()  # os._exit skips atexit, flush the log queue first
     import os
     os._exit(0)
 
@@ -15,19 +15,27 @@ from common.app_setup import (
 )
 
 
+import logging
 import subprocess
+import threading
 import typer
 import json
 import os
 import signal
+import socket
 import sys
 import time
 import psutil
 
+# Configured by setup_logging when run as a CLI; importing the module (e.g. from tests) leaves logging alone
+logger = logging.getLogger(__name__)
+
 app = typer.Typer(add_completion=False, help="Manage the mock_hypervisor daemon. If no port is passed to start, an automatic port will be selected. If no command is given, status is shown.")
 
 @app.callback(invoke_without_command=True)
 def main(ctx: typer.Context):
+    setup_logging(app_name="mock_hypervisor_launcher", daemon=False)
+    # monkeypatch_print()  # Disabled: Rich print adds unwanted newlines and formatting to machine-readable output (e.g., JSON)
     if ctx.invoked_subcommand is None:
         try:
             ctx.invoke(status)
@@ -56,12 +64,36 @@ def _start_daemon(port=None):
                     break
             except Exception:
                 continue
-    time.sleep(0.5)
+    if selected_port:
+        _wait_port(selected_port, proc)
+    else:
+        time.sleep(0.5)
     if proc.poll() is not None:
         print_error(f"Failed to start daemon. Process exited with code {proc.returncode}.")
         raise typer.Exit(1)
+    # Keep reading the daemon output, so the pipe never fills up, and wait for it when it exits
+    threading.Thread(target=_reap, args=(proc,), daemon=True, name="mockvisor-reaper").start()
     return proc.pid, selected_port or port
 
+def _reap(proc: subprocess.Popen):
+    """Drain the stdout of a started daemon until it exits, then collect its exit status."""
+    assert proc.stdout is not None
+    with proc.stdout:
+        for _ in proc.stdout:
+            pass
+    proc.wait()
+
+def _wait_port(port, proc, timeout=5.0):
+    """Wait until the daemon accepts TCP connections on port, instead of sleeping a fixed time.
+    Returns early if the process exits, or after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and proc.poll() is None:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                return
+        except OSError:
+            time.sleep(0.02)
+
 
 
 @app.command()
@@ -71,33 +103,42 @@ def start(port: int | None = typer.Option(None, help="Port to start the daemon o
     If already running: resturn error.
     returns json in any case.
     """
-    result = {}
-    exit_code = 0
+    result = start_daemon(port)
+    # No newline sanitization
+    print(json.dumps(result))
+    raise typer.Exit(result["returncode"])
+
+def start_daemon(port: int | None = None) -> dict:
+    """Start the daemon unless one is already running, without a CLI round trip.
+    Returns the same dict the start command prints: returncode, msg, pid and port.
+    Usable in-process, e.g. from test fixtures.
+    """
     try:
         daemon_pid = _find_daemon_pid()
         msg = "A mock_hypervisor daemon is already running"
         running_port = _get_listening_port_of_pid(daemon_pid)
-        result = {"returncode": 0, "msg": msg, "pid": daemon_pid, "port": running_port or "unknown"}
-        exit_code = 0
+        return {"returncode": 0, "msg": msg, "pid": daemon_pid, "port": running_port or "unknown"}
     except psutil.NoSuchProcess:
         pid, used_port = _start_daemon(port)
-        result = {"returncode": 0, "msg": "Started daemon", "pid": pid, "port": used_port}
-        exit_code = 0
-    # No newline sanitization
-    print(json.dumps(result))
-    raise typer.Exit(exit_code)
+        return {"returncode": 0, "msg": "Started daemon", "pid": pid, "port": used_port}
 
 @app.command()
 def stop():
     """Stop the mock_hypervisor daemon by finding its process."""
+    result = stop_daemon()
+    print(json.dumps(result))
+    raise typer.Exit(result["returncode"])
+
+def stop_daemon() -> dict:
+    """Stop the running daemon, without a CLI round trip.
+    Returns the same dict the stop command prints: returncode, msg, and method or error.
+    Usable in-process, e.g. from test fixtures.
+    """
     import httpx
-    result = {}
     try:
         pid = _find_daemon_pid()
     except psutil.NoSuchProcess as e:
-        result = {"returncode": 0, "msg": "Daemon not running.", "error": str(e)}
-        print(json.dumps(result))
-        raise typer.Exit(0)
+        return {"returncode": 0, "msg": "Daemon not running.", "error": str(e)}
     port = _get_listening_port_of_pid(pid)
     shutdown_method = None
     shutdown_status = None
@@ -156,13 +197,9 @@ def stop():
                 pass
             time.sleep(0.1)
     if stopped:
-        result = {"returncode": 0, "msg": f"Stopped daemon (PID {pid})", "method": shutdown_method}
-        print(json.dumps(result))
-        raise typer.Exit(0)
+        return {"returncode": 0, "msg": f"Stopped daemon (PID {pid})", "method": shutdown_method}
     else:
-        result = {"returncode": 1, "msg": f"Failed to stop daemon (PID {pid})", "method": shutdown_method}
-        print(json.dumps(result))
-        raise typer.Exit(1)
+        return {"returncode": 1, "msg": f"Failed to stop daemon (PID {pid})", "method": shutdown_method}
 
 @app.command()
 def kill():
@@ -253,9 +290,5 @@ def _get_listening_port_of_pid(pid: int | None) -> int | None:
     return None
 
 
-# Assign logger globally
-logger = setup_logging(app_name="mock_hypervisor_launcher", daemon=False)
-# monkeypatch_print()  # Disabled: Rich print adds unwanted newlines and formatting to machine-readable output (e.g., JSON)
-
 if __name__ == "__main__":
     app()
\ No newline at end of file
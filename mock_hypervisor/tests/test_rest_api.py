@@ -6,6 +6,9 @@ import sys
 import httpx
 import pytest
 import json
+import uuid
+
+from mock_hypervisor.launcher import start_daemon
 
 LAUNCHER = [sys.executable, '-m', 'mock_hypervisor.launcher']
 
@@ -21,20 +24,11 @@ def get_daemon_status():
 
 @pytest.fixture(scope="function")
 def daemon():
-    result = subprocess.run(LAUNCHER + ['start'], capture_output=True, text=True)
-    try:
-        data = json.loads(result.stdout.strip())
-        port = data.get("port")
-        if port is not None and port != "unknown":
-            try:
-                port = int(port)
-            except Exception:
-                pass
-            yield port
-            return
-    except Exception:
-        pass
-    raise RuntimeError("Daemon did not start or did not output a valid port.")
+    # Start in-process through the launcher: no extra interpreter, no stdout parsing
+    port = start_daemon().get("port")
+    if port is None or port == "unknown":
+        raise RuntimeError("Daemon did not start or did not report a valid port.")
+    yield int(port)
 
 
 # Add a test that stops the daemon via REST
@@ -137,3 +131,41 @@ def test_clone_vm_and_lifecycle(daemon):
 
 
 
+
+def test_batch_endpoints(daemon):
+    port = daemon
+    # The daemon may outlive a failed run: unique names don't collide with its leftovers
+    suffix = uuid.uuid4().hex[:8]
+    with httpx.Client() as client:
+        # Create several VMs at once
+        r = client.post(f'http://127.0.0.1:{port}/vms:batch', json=[{"name": f"Batch1-{suffix}"}, {"name": f"Batch2-{suffix}"}])
+        assert r.status_code == 201
+        ids = [vm["id"] for vm in r.json()]
+        try:
+            assert len(ids) == 2
+            # Negative: an invalid config rejects the whole batch
+            r = client.post(f'http://127.0.0.1:{port}/vms:batch', json=[{"name": f"Batch3-{suffix}"}, {"name": ""}])
+            assert r.status_code in (400, 422)
+            r = client.get(f'http://127.0.0.1:{port}/vms', params={"search": f"Batch3-{suffix}"})
+            assert r.json() == []
+            # Negative: duplicate names inside the batch
+            r = client.post(f'http://127.0.0.1:{port}/vms:batch', json=[{"name": f"Batch4-{suffix}"}, {"name": f"Batch4-{suffix}"}])
+            assert r.status_code == 409
+            # Same lifecycle action on all of them
+            r = client.post(f'http://127.0.0.1:{port}/vms:batch-action', json={"ids": ids, "action": "start"})
+            assert r.status_code == 200
+            assert [vm["status"] for vm in r.json()] == ["running", "running"]
+            # Negative: invalid action, unknown VM
+            r = client.post(f'http://127.0.0.1:{port}/vms:batch-action', json={"ids": ids, "action": "fly"})
+            assert r.status_code == 400
+            r = client.post(f'http://127.0.0.1:{port}/vms:batch-action', json={"ids": ids + ["nonexistent"], "action": "stop"})
+            assert r.status_code == 404
+            # Delete them all
+            r = client.post(f'http://127.0.0.1:{port}/vms:batch-delete', json={"ids": ids})
+            assert r.status_code == 204
+            r = client.post(f'http://127.0.0.1:{port}/vms:batch-delete', json={"ids": ids})
+            assert r.status_code == 404
+        finally:
+            # Cleanup if the test failed before deleting them
+            for vm_id in ids:
+                client.delete(f'http://127.0.0.1:{port}/vms/{vm_id}')